@@ -0,0 +1,79 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+from rest_framework.response import Response
+
+
+class AsyncAPIViewMixin:
+    """
+    Асинхронный dispatch для представлений и ViewSet'ов DRF под ASGI.
+
+    Аутентификация, права и троттлинг (APIView.initial) выполняются в потоке
+    через sync_to_async, обработчики async def работают в цикле событий с
+    асинхронным ORM. Синхронные обработчики (например, запись во ViewSet)
+    выполняются в потоке, как синхронные представления под ASGI.
+
+    Подключается перед классом представления: AsyncX(AsyncAPIViewMixin, X).
+    """
+
+    @classonlymethod
+    def as_view(cls, *args, **initkwargs):
+        view = super().as_view(*args, **initkwargs)
+        # ViewSetMixin.as_view не отмечает view асинхронным сам
+        return markcoroutinefunction(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+                if hasattr(response, '__await__'):
+                    # View.options асинхронного представления возвращает корутину
+                    response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        """get_object на асинхронном ORM: 404 и проверка прав на объект - как в GenericAPIView"""
+        queryset = self.filter_queryset(await sync_to_async(self.get_queryset)())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404('No %s matches the given query.' % queryset.model._meta.object_name)
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        """ListModelMixin.list на асинхронном ORM"""
+        queryset = self.filter_queryset(await sync_to_async(self.get_queryset)())
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        objects = [obj async for obj in queryset.aiterator(chunk_size=2000)]
+        return Response(self.get_serializer(objects, many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """RetrieveModelMixin.retrieve на асинхронном ORM"""
+        return Response(self.get_serializer(await self.aget_object()).data)
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
 from django.conf import settings
 from celery.schedules import crontab
 
@@ -31,3 +32,24 @@ app.autodiscover_tasks()
 # }
 
 app.conf.timezone = settings.TIME_ZONE
+
+
+@worker_init.connect
+def close_db_connections(**kwargs):
+    """Главный процесс воркера не передаёт соединения и пулы БД процессам пула"""
+    from config.db import close_connections
+
+    close_connections()
+
+
+@worker_process_init.connect
+def configure_db_pool(**kwargs):
+    """
+    Соединения с БД в процессе воркера: пул (DB_POOL) или постоянные соединения, как у веб-процессов.
+
+    После задачи Celery возвращает соединение в пул или оставляет открытым до
+    CONN_MAX_AGE; пул процесса меньше, чем у веб-воркера.
+    """
+    from config.db import resize_pools
+
+    resize_pools(min_size=1, max_size=settings.DB_POOL_WORKER_MAX_SIZE)
@@ -0,0 +1,25 @@
+from django.db import connections
+
+
+def close_connections():
+    """
+    Закрывает соединения с БД и пулы psycopg процесса перед fork.
+
+    Дочерние процессы открывают свои соединения и пулы: унаследованные сокеты
+    были бы общими с родителем, а фоновые потоки пула после fork не работают.
+    Пул создаётся закрытым и открывается при первом соединении, поэтому
+    закрывать его до этого момента дёшево.
+    """
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        close_pool = getattr(connection, 'close_pool', None)
+        if close_pool is not None:
+            close_pool()
+
+
+def resize_pools(min_size, max_size):
+    """Меняет размер пулов, ещё не созданных в этом процессе (например, в процессе воркера Celery)"""
+    for alias in connections:
+        pool_options = connections.settings[alias]['OPTIONS'].get('pool')
+        if isinstance(pool_options, dict):
+            pool_options.update(min_size=min_size, max_size=max_size)
@@ -0,0 +1,92 @@
+"""
+Конфигурация Gunicorn для production.
+
+Запуск: gunicorn -c python:config.gunicorn
+
+Мастер-процесс загружает Django, URLconf и сериализаторы до fork (preload_app),
+затем объекты переводятся в постоянное поколение сборщика мусора (gc.freeze),
+чтобы сборщик в воркерах не трогал их и страницы памяти оставались общими
+(copy-on-write). Воркеры перезапускаются после max_requests запросов.
+
+Переменные окружения:
+- WEB_BIND: Адрес (по умолчанию 0.0.0.0:8000)
+- WEB_CONCURRENCY: Количество воркеров (по умолчанию 2 * CPU + 1, для ASGI - CPU)
+- WEB_THREADS: Потоков в воркере WSGI (по умолчанию 1; больше 1 - воркер gthread)
+- WEB_MAX_REQUESTS, WEB_MAX_REQUESTS_JITTER: Перезапуск воркера после стольких запросов
+- WEB_TIMEOUT: Таймаут запроса, в секундах
+- ASYNC_VIEWS=True: ASGI-приложение и воркер asgi (см. config/async_views.py)
+"""
+import gc
+import os
+
+from dotenv import load_dotenv
+
+# Те же переменные, что видит config/settings.py (в том числе ASYNC_VIEWS)
+load_dotenv(override=True)
+
+
+def cpu_count():
+    """CPU, доступные процессу (с учётом привязки к ядрам в контейнере)"""
+    if hasattr(os, 'process_cpu_count'):
+        return os.process_cpu_count() or 1
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+
+ASYNC = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
+
+if ASYNC:
+    # Один процесс с циклом событий на ядро обслуживает много ожидающих запросов
+    wsgi_app = 'config.asgi:application'
+    worker_class = 'asgi'
+    workers = int(os.getenv('WEB_CONCURRENCY') or cpu_count())
+else:
+    wsgi_app = 'config.wsgi:application'
+    threads = int(os.getenv('WEB_THREADS') or 1)
+    worker_class = 'gthread' if threads > 1 else 'sync'
+    workers = int(os.getenv('WEB_CONCURRENCY') or 2 * cpu_count() + 1)
+
+preload_app = True
+max_requests = int(os.getenv('WEB_MAX_REQUESTS') or 2000)
+max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER') or 200)
+timeout = int(os.getenv('WEB_TIMEOUT') or 30)
+graceful_timeout = 30
+keepalive = 5
+
+# Файлы heartbeat воркеров в памяти, а не на диске контейнера
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+errorlog = '-'
+
+
+def warm_up():
+    """Импортирует то, что иначе загрузилось бы в каждом воркере при первом запросе"""
+    from django.urls import get_resolver
+    from rest_framework.settings import api_settings
+
+    # Все представления, а через них сериализаторы, пагинаторы и права
+    get_resolver().url_patterns
+    api_settings.DEFAULT_RENDERER_CLASSES
+    api_settings.DEFAULT_PARSER_CLASSES
+    api_settings.DEFAULT_AUTHENTICATION_CLASSES
+
+    from materials import serializers as materials_serializers  # noqa: F401
+    from users import serializers as users_serializers  # noqa: F401
+
+
+def when_ready(server):
+    # Приложение уже загружено (preload_app), воркеров ещё нет
+    warm_up()
+    gc.collect()
+    server.log.info('Django загружен в мастере, воркеров: %s (%s)', server.cfg.workers, server.cfg.worker_class_str)
+
+
+def pre_fork(server, worker):
+    from config.db import close_connections
+
+    # Соединения и пул БД, открытые при загрузке, не должны достаться воркерам общими сокетами
+    close_connections()
+    # Объекты мастера (включая созданные после прошлого fork) не сканируются сборщиком в воркерах
+    gc.freeze()
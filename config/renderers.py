@@ -0,0 +1,112 @@
+import csv
+import math
+from decimal import Decimal
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+# datetime отдаются в default, чтобы формат совпадал с JSONEncoder DRF ("Z" вместо "+00:00")
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def _has_non_finite(data):
+    """Есть ли в данных NaN или бесконечность (float или Decimal)"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, Decimal):
+            if not value.is_finite():
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson.
+
+    Типы, которых orjson не знает (Decimal, ленивые строки перевода, datetime
+    и т.д.), преобразуются тем же JSONEncoder.default, что и в DRF, поэтому
+    результат совпадает побайтно. Для ответов с отступами (browsable API,
+    ?indent) и данных, которые orjson не может закодировать, используется
+    стандартный json.
+
+    orjson записывает NaN и бесконечность как null, поэтому такие данные тоже
+    отдаются JSONRenderer: при STRICT_JSON он выбрасывает ValueError, иначе
+    пишет NaN/Infinity.
+    """
+    encoder_default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Без null в ответе NaN и бесконечности нет, обход данных не нужен
+        if b'null' in ret and _has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Как и DRF, экранируем \u2028 и \u2029
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Построчный JSON: один объект на строку. Строки кодируются основным JSON-рендерером"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(self.iter_rows(data if isinstance(data, list) else [data]))
+
+    def iter_rows(self, rows):
+        json_renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        for row in rows:
+            yield json_renderer.render(row) + b'\n'
+
+
+class _Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV с заголовком из ключей первой строки"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(self.iter_rows(data if isinstance(data, list) else [data]))
+
+    def iter_rows(self, rows):
+        writer = csv.writer(_Echo())
+        header = None
+        for row in rows:
+            if header is None:
+                header = list(row)
+                yield writer.writerow(header).encode(self.charset)
+            yield writer.writerow(['' if row[key] is None else row[key] for key in header]).encode(self.charset)
@@ -49,7 +49,7 @@ ROOT_URLCONF = "config.urls"
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
-        "DIRS": [],
+        "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
@@ -62,30 +62,70 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
 
+# Асинхронные представления чтения курсов, уроков и статуса платежа (при запуске под ASGI)
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "False") == "True"
 
-# Настройки JWT-токенов
+# JSON через orjson (config/renderers.py, config/parsers.py); USE_ORJSON=False - стандартный json DRF
+USE_ORJSON = os.getenv("USE_ORJSON", "True") == "True"
+
+# Аутентификация по claims токена без запроса пользователя (users/authentication.py)
+JWT_STATELESS_AUTH = os.getenv("JWT_STATELESS_AUTH", "True") == "True"
+
+# Настройки DRF: JWT-аутентификация, рендереры и парсеры
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication' if JWT_STATELESS_AUTH
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.ORJSONRenderer' if USE_ORJSON else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'config.parsers.ORJSONParser' if USE_ORJSON else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
 
 # Database
+# Соединения с БД: пул psycopg 3 на процесс (DB_POOL=True, по умолчанию вместе с ASYNC_VIEWS:
+# под ASGI запросы выполняются в разных потоках и постоянные соединения не переиспользуются)
+# или постоянные соединения на поток, проверяемые перед использованием (DB_CONN_MAX_AGE, сек)
+DB_POOL = (os.getenv("DB_POOL") or str(ASYNC_VIEWS)) == "True"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", 60))
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": os.getenv("NAME"),
         "USER": os.getenv("USER"),
         "PASSWORD": os.getenv("PASSWORD"),
         "HOST": os.getenv("HOST"),
         "PORT": os.getenv("PORT"),
+        "CONN_MAX_AGE": 0 if DB_POOL else DB_CONN_MAX_AGE,
+        # Постоянное соединение проверяется в начале запроса, соединение пула - при выдаче из пула
+        "CONN_HEALTH_CHECKS": True,
         "OPTIONS": {
             "client_encoding": "UTF8",
         },
     }
 }
+if DB_POOL:
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        "timeout": DB_POOL_TIMEOUT,
+    }
+
+# Размер пула в процессе воркера Celery: задачи в нём выполняются по одной
+DB_POOL_WORKER_MAX_SIZE = int(os.getenv("DB_POOL_WORKER_MAX_SIZE", 2))
 
 
 # Password validation
@@ -138,11 +178,63 @@ AUTH_USER_MODEL = "users.User"
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    # last_login нужен для деактивации неактивных пользователей (users/tasks.py)
+    'UPDATE_LAST_LOGIN': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.ClaimsTokenRefreshSerializer',
 }
 
+# Настройки кэша: Redis в продакшене, память процесса локально и в тестах
+CACHE_URL = os.getenv("CACHE_URL")
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Время жизни закэшированных ответов CourseViewSet, в секундах
+COURSE_CACHE_TIMEOUT = int(os.getenv("COURSE_CACHE_TIMEOUT", 300))
+
+# Время жизни закэшированной роли модератора, в секундах
+ROLE_CACHE_TIMEOUT = int(os.getenv("ROLE_CACHE_TIMEOUT", 3600))
+
+# Быстрый путь чтения списков в сериализаторах materials (см. materials/fast_serializers.py)
+FAST_READ_SERIALIZERS = os.getenv("FAST_READ_SERIALIZERS", "True") == "True"
+
 # Настройки Stripe
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+
+# Клиент Stripe (materials/services.py): пул соединений, таймауты (с), повторы и предохранитель
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")  # Например, адрес stripe-mock; по умолчанию api.stripe.com
+STRIPE_POOL_SIZE = int(os.getenv("STRIPE_POOL_SIZE", 10))
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", 3))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", 10))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", 2))
+STRIPE_RETRY_BASE_DELAY = float(os.getenv("STRIPE_RETRY_BASE_DELAY", 0.3))
+STRIPE_RETRY_MAX_DELAY = float(os.getenv("STRIPE_RETRY_MAX_DELAY", 2))
+STRIPE_BREAKER_THRESHOLD = int(os.getenv("STRIPE_BREAKER_THRESHOLD", 5))
+STRIPE_BREAKER_RESET_TIMEOUT = float(os.getenv("STRIPE_BREAKER_RESET_TIMEOUT", 30))
+# Не чаще раза в столько секунд статус платежа запрашивается у Stripe (обычно его присылает вебхук)
+STRIPE_STATUS_TTL = int(os.getenv("STRIPE_STATUS_TTL", 60))
+# Глубина сверки статусов платежей со Stripe (users.tasks.reconcile_payment_statuses), часы
+PAYMENT_RECONCILE_WINDOW_HOURS = int(os.getenv("PAYMENT_RECONCILE_WINDOW_HOURS", 72))
+
+# Цены по умолчанию для новых записей каталога (users.models.StripePrice)
+DEFAULT_COURSE_PRICE = os.getenv("DEFAULT_COURSE_PRICE", "15000")
+DEFAULT_LESSON_PRICE = os.getenv("DEFAULT_LESSON_PRICE", "2000")
+
+# Создание сессии оплаты в задаче Celery (ответ 202) вместо запроса
+STRIPE_ASYNC_CHECKOUT = os.getenv("STRIPE_ASYNC_CHECKOUT", "True") == "True"
 
 # Настройки Celery
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
@@ -165,6 +257,21 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 SERVER_EMAIL = EMAIL_HOST_USER
 
+# Размер пакета получателей в задаче уведомлений (materials/tasks.py)
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 500))
+
+# Окно (в секундах), за которое изменения курса объединяются в одно уведомление
+COURSE_NOTIFICATION_WINDOW = int(os.getenv('COURSE_NOTIFICATION_WINDOW', 900))
+
+# Деактивация неактивных пользователей (users/tasks.py)
+INACTIVE_USER_DAYS = int(os.getenv('INACTIVE_USER_DAYS', 30))
+DEACTIVATION_CHUNK_SIZE = int(os.getenv('DEACTIVATION_CHUNK_SIZE', 1000))
+
+# Outbox задач Celery (materials/outbox.py): публикация после фиксации транзакции в фоновом потоке
+OUTBOX_RELAY_IN_THREAD = os.getenv('OUTBOX_RELAY_IN_THREAD', 'True') == 'True'
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', 7))
+
 # Расписание периодических задач
 CELERY_BEAT_SCHEDULE = {
     # Проверка неактивных пользователей - каждый день в 2:00 ночи
@@ -182,4 +289,20 @@ CELERY_BEAT_SCHEDULE = {
         'args': (),
         'kwargs': {},
     },
+
+    # Сверка статусов незавершённых платежей со Stripe - каждые 30 минут
+    'reconcile-payment-statuses': {
+        'task': 'users.tasks.reconcile_payment_statuses',
+        'schedule': crontab(minute='*/30'),
+        'args': (),
+        'kwargs': {},
+    },
+
+    # Публикация outbox, не отправленного после фиксации транзакций - каждую минуту
+    'relay-outbox-every-minute': {
+        'task': 'materials.tasks.relay_outbox',
+        'schedule': crontab(),
+        'args': (),
+        'kwargs': {},
+    },
 }
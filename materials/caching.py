@@ -0,0 +1,54 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+GLOBAL_GENERATION = 'courses'
+
+
+def _generation_key(name):
+    return f'materials:gen:{name}'
+
+
+def user_generation(user_id):
+    return f'user:{user_id}'
+
+
+def bump_generation(name):
+    """
+    Инвалидирует все ответы, зависящие от поколения name.
+
+    Старые ключи не удаляются: они перестают совпадать и вытесняются по TTL.
+    """
+    key = _generation_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ поколения вытеснен или ещё не создан
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def get_generations(*names):
+    """Возвращает текущие значения поколений за один запрос к кэшу"""
+    keys = [_generation_key(name) for name in names]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # Начальное значение от времени, чтобы после вытеснения счётчика не вернуться к старым ключам
+            cache.add(key, time.time_ns(), timeout=None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def course_response_cache_key(request, scope):
+    """
+    Ключ ответа CourseViewSet.
+
+    Зависит от области видимости (все курсы или только свои), пользователя
+    (из-за is_subscribed), поколений и полного URL с параметрами запроса.
+    """
+    user_id = request.user.pk
+    generations = get_generations(GLOBAL_GENERATION, user_generation(user_id))
+    url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    version = '.'.join(str(generation) for generation in generations)
+    return f'materials:courses:{scope}:{user_id}:{version}:{url_hash}'
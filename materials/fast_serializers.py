@@ -0,0 +1,180 @@
+from operator import attrgetter, itemgetter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import models
+from django.db.models.fields.files import FieldFile
+from django.utils.encoding import iri_to_uri
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PKOnlyObject, PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+
+# Способы получения значения поля
+INT, STR, DATETIME, FILE, PK, METHOD, GENERIC = range(7)
+
+# Планы по (класс сериализатора, набор полей), строятся один раз
+_plans = {}
+
+
+def _field_kind(field, source):
+    if isinstance(field, serializers.SerializerMethodField):
+        return METHOD
+    if not source:
+        return GENERIC
+    if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+        return PK
+    if isinstance(field, serializers.IntegerField):
+        return INT
+    if isinstance(field, serializers.CharField):
+        return STR
+    if isinstance(field, serializers.DateTimeField):
+        # format=None (объект datetime) и свои форматы - через to_representation поля
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if isinstance(output_format, str) and output_format.lower() == ISO_8601:
+            return DATETIME
+        return GENERIC
+    if (isinstance(field, serializers.FileField)
+            and getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)):
+        return FILE
+    return GENERIC
+
+
+def _compile_plan(serializer):
+    """
+    План чтения: для каждого поля - имя, способ, атрибут объекта и ключ строки.
+
+    Простые поля читаются и преобразуются напрямую, остальные идут через
+    get_attribute/to_representation самого поля DRF.
+    """
+    model = serializer.Meta.model
+    plan = []
+    for field in serializer._readable_fields:
+        source = field.source_attrs[0] if len(field.source_attrs) == 1 else None
+        key = field.source_attrs[0] if field.source_attrs else field.field_name
+        kind = _field_kind(field, source)
+        extra = None
+
+        if kind == METHOD:
+            key = field.field_name
+        elif kind == PK:
+            extra = model._meta.get_field(source).attname
+        elif isinstance(field, serializers.FileField):
+            # В строках .values() файл хранится именем, а не FieldFile
+            extra = model._meta.get_field(key)
+        plan.append((field.field_name, kind, source, key, extra))
+    return plan
+
+
+def get_plan(serializer):
+    plan_key = (type(serializer), tuple(serializer.fields))
+    if plan_key not in _plans:
+        _plans[plan_key] = _compile_plan(serializer)
+    return _plans[plan_key]
+
+
+def _clear_plans(*, setting, **kwargs):
+    # Способ поля зависит от api_settings (DATETIME_FORMAT, UPLOADED_FILES_USE_URL)
+    if setting == 'REST_FRAMEWORK':
+        _plans.clear()
+
+
+setting_changed.connect(_clear_plans)
+
+
+def _datetime_converter(field):
+    # То же, что DateTimeField.to_representation для ISO 8601, но часовой пояс выбирается один раз
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+    def convert(value):
+        if field_timezone is None or isinstance(value, str) or value.utcoffset() is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def _file_converter(field, model_field):
+    # То же, что FileField.to_representation, но без разбора адреса запроса на каждой строке
+    storage = model_field.storage
+    request = field.context.get('request', None)
+    scheme_host = request.build_absolute_uri('/')[:-1] if request is not None else None
+
+    def convert(value):
+        name = value if isinstance(value, str) else value.name
+        if not name:
+            return None
+        url = storage.url(name)
+        if request is None:
+            return url
+        if url.startswith('/') and not url.startswith('//') and '/./' not in url and '/../' not in url:
+            return iri_to_uri(scheme_host + url)
+        return request.build_absolute_uri(url)
+    return convert
+
+
+def _build_step(serializer, rows, name, kind, source, key, extra):
+    """Функция строка -> значение поля для экземпляров (rows=False) или строк .values()"""
+    if kind == METHOD:
+        # В строках .values() значения методов ожидаются уже посчитанными (аннотации)
+        return itemgetter(key) if rows else getattr(serializer, serializer.fields[name].method_name)
+    if kind == PK:
+        if rows:
+            return lambda row: row[extra] if extra in row else row[key]
+        return attrgetter(extra)
+
+    field = serializer.fields[name]
+    if kind == GENERIC:
+        def step(obj):
+            if rows:
+                value = obj[key]
+                if extra is not None and value is not None and not isinstance(value, FieldFile):
+                    value = FieldFile(None, extra, value)
+            else:
+                value = field.get_attribute(obj)
+            check_for_none = value.pk if isinstance(value, PKOnlyObject) else value
+            return None if check_for_none is None else field.to_representation(value)
+        return step
+
+    getter = itemgetter(key) if rows else attrgetter(source)
+    if kind == INT:
+        convert = int
+    elif kind == STR:
+        convert = str
+    elif kind == DATETIME:
+        convert = _datetime_converter(field)
+    else:
+        convert = _file_converter(field, extra)
+
+    def step(obj):
+        value = getter(obj)
+        return None if value is None else convert(value)
+    return step
+
+
+def serialize_rows(serializer, rows):
+    """Сериализует экземпляры моделей или строки .values() по плану сериализатора"""
+    plan = get_plan(serializer)
+    steps = {}
+    result = []
+    for row in rows:
+        is_row = isinstance(row, dict)
+        if is_row not in steps:
+            steps[is_row] = [(step[0], _build_step(serializer, is_row, *step)) for step in plan]
+        result.append({name: step(row) for name, step in steps[is_row]})
+    return result
+
+
+class FastListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer с быстрым путём чтения.
+
+    Вместо to_representation дочернего сериализатора для каждой строки
+    использует заранее построенный план полей. Результат после рендеринга
+    совпадает с обычным ListSerializer; отключается FAST_READ_SERIALIZERS = False.
+    """
+
+    def to_representation(self, data):
+        if not getattr(settings, 'FAST_READ_SERIALIZERS', True):
+            return super().to_representation(data)
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return serialize_rows(self.child, iterable)
@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает стоимость соединения с БД на запрос: новое соединение, "
+        "постоянное с проверкой (CONN_MAX_AGE) и пул psycopg 3"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество имитируемых запросов')
+        parser.add_argument('--database', default='default', help='Алиас БД из settings.DATABASES')
+
+    def handle(self, *args, **options):
+        base = dict(connections[options['database']].settings_dict)
+        base['OPTIONS'] = {key: value for key, value in base['OPTIONS'].items() if key != 'pool'}
+        modes = [
+            ('новое соединение', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+            ('постоянное', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}),
+        ]
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            self.stdout.write('psycopg_pool не установлен, пул пропущен')
+        else:
+            # Как в settings при DB_POOL=True: проверка соединения при выдаче из пула
+            modes.append(('пул psycopg', {
+                'CONN_MAX_AGE': 0,
+                'CONN_HEALTH_CHECKS': True,
+                'OPTIONS': {**base['OPTIONS'], 'pool': {'min_size': 1, 'max_size': 2}},
+            }))
+
+        for index, (name, overrides) in enumerate(modes):
+            timings, backends = self.run_requests({**base, **overrides}, f'benchmark_{index}', options['requests'])
+            self.stdout.write(
+                f'{name:>18}: p50 {statistics.median(timings) * 1000:.3f} мс, '
+                f'p95 {self.percentile(timings, 95) * 1000:.3f} мс, соединений с сервером: {backends}'
+            )
+
+    def run_requests(self, settings_dict, alias, count):
+        """
+        Цикл запроса как в Django: close_if_unusable_or_obsolete на входе и выходе, между ними один запрос.
+
+        Возвращает время запросов и число разных серверных процессов (соединений).
+        """
+        backend = load_backend(settings_dict['ENGINE'])
+        connection = backend.DatabaseWrapper(settings_dict, alias)
+        backends = set()
+        timings = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                connection.close_if_unusable_or_obsolete()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_backend_pid()')
+                    backends.add(cursor.fetchone()[0])
+                connection.close_if_unusable_or_obsolete()
+                timings.append(time.perf_counter() - started)
+        except Exception as e:
+            raise CommandError(f'Ошибка соединения с БД: {e}')
+        finally:
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+        return timings, len(backends)
+
+    @staticmethod
+    def percentile(values, percent):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
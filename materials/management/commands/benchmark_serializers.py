@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from materials.models import Course, Lesson
+from materials.serializers import CourseSerializer, LessonSerializer
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость обычной и быстрой сериализации списков уроков и курсов (без БД)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Количество уроков на странице')
+        parser.add_argument('--repeat', type=int, default=3, help='Количество повторов, берётся лучший')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        context = {'request': APIRequestFactory().get('/api/lessons/', HTTP_HOST='localhost')}
+        now = timezone.now()
+
+        lessons = [
+            Lesson(
+                id=i,
+                title=f'Урок {i}',
+                description='Описание урока ' * 20,
+                preview=f'lessons/previews/{i}.png' if i % 2 else None,
+                video_link=f'https://www.youtube.com/watch?v={i}',
+                course_id=i // 10 + 1,
+                owner_id=1,
+                updated_at=now,
+            )
+            for i in range(1, rows + 1)
+        ]
+        rows_values = [
+            {
+                'id': lesson.id, 'title': lesson.title, 'description': lesson.description,
+                'preview': lesson.preview.name, 'video_link': lesson.video_link,
+                'course_id': lesson.course_id, 'owner_id': lesson.owner_id, 'updated_at': lesson.updated_at,
+            }
+            for lesson in lessons
+        ]
+
+        courses = []
+        for course_id in range(1, rows // 10 + 1):
+            course = Course(id=course_id, title=f'Курс {course_id}', description='Описание курса', owner_id=1)
+            course.lessons_count = 10
+            course.is_subscribed = bool(course_id % 2)
+            course._prefetched_objects_cache = {'lessons': lessons[(course_id - 1) * 10:course_id * 10]}
+            courses.append(course)
+
+        # Обычный DRF не умеет строки .values(), для них эталон - те же уроки объектами
+        cases = [
+            (f'LessonSerializer, {rows} объектов', LessonSerializer, lessons, lessons),
+            (f'LessonSerializer, {rows} строк .values()', LessonSerializer, lessons, rows_values),
+            (f'CourseSerializer, {len(courses)} курсов по 10 уроков', CourseSerializer, courses, courses),
+        ]
+        for title, serializer_class, baseline_data, data in cases:
+            with override_settings(FAST_READ_SERIALIZERS=False):
+                slow, slow_time = self.measure(serializer_class, baseline_data, context, repeat)
+            fast, fast_time = self.measure(serializer_class, data, context, repeat)
+            if JSONRenderer().render(slow) != JSONRenderer().render(fast):
+                self.stderr.write(f'{title}: результаты различаются')
+            self.stdout.write(
+                f'{title}: DRF {slow_time * 1000:.1f} мс, быстрый путь {fast_time * 1000:.1f} мс, '
+                f'ускорение x{slow_time / fast_time:.1f}'
+            )
+
+    @staticmethod
+    def measure(serializer_class, data, context, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = serializer_class(data, many=True, context=context).data
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
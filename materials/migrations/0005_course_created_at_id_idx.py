@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0004_course_created_at_course_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["created_at", "id"], name="course_created_at_id_idx"
+            ),
+        ),
+    ]
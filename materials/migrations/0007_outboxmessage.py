@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0006_lesson_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task_name", models.CharField(max_length=255, verbose_name="Задача")),
+                (
+                    "args",
+                    models.JSONField(
+                        blank=True, default=list, verbose_name="Аргументы"
+                    ),
+                ),
+                (
+                    "kwargs",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="Именованные аргументы"
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="Ключ события"
+                    ),
+                ),
+                (
+                    "eta",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время выполнения"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "published_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата публикации"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сообщение outbox",
+                "verbose_name_plural": "Сообщения outbox",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("published_at__isnull", True)),
+                        fields=["id"],
+                        name="outbox_pending_idx",
+                    ),
+                    models.Index(fields=["key", "eta"], name="outbox_key_eta_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0007_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxmessage",
+            name="processed_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Дата обработки"
+            ),
+        ),
+    ]
@@ -0,0 +1,135 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    Условный GET (ETag / Last-Modified) для DRF-представлений.
+
+    Валидаторы строятся по дешёвому агрегату (максимальный updated_at и
+    количество строк), поэтому ответ 304 отдаётся без загрузки объектов и
+    сериализации. Вызывать после проверки прав, т.е. внутри обработчика.
+
+    Last-Modified отдаётся только для одного объекта с его updated_at.
+    Максимум updated_at по набору строк не растёт при удалении строки или
+    выходе её из выборки и может уменьшиться, поэтому для агрегатов
+    last_modified - None и 304 отдаётся только по ETag.
+    """
+    etag = None
+    last_modified = None
+
+    def get_validator_queryset(self, request, *args, **kwargs):
+        """Queryset, по которому считается агрегат get_validator_aggregates()"""
+        raise NotImplementedError
+
+    def get_validator_aggregates(self):
+        """Агрегаты для валидаторов: {имя: выражение}"""
+        raise NotImplementedError
+
+    def build_validator_state(self, state):
+        """
+        Возвращает (last_modified, state) по значениям агрегата или None, если валидаторов нет.
+
+        state - любые значения, изменение которых должно менять ETag;
+        last_modified для агрегатов - None (см. описание класса).
+        """
+        raise NotImplementedError
+
+    def get_validator_state(self, request, *args, **kwargs):
+        queryset = self.get_validator_queryset(request, *args, **kwargs)
+        return self.build_validator_state(queryset.aggregate(**self.get_validator_aggregates()))
+
+    async def aget_validator_state(self, request, *args, **kwargs):
+        # Queryset строится в потоке: права и роль пользователя могут читать БД
+        queryset = await sync_to_async(self.get_validator_queryset)(request, *args, **kwargs)
+        return self.build_validator_state(await queryset.aaggregate(**self.get_validator_aggregates()))
+
+    def not_modified(self, request, *args, **kwargs):
+        """Возвращает 304/412, если у клиента актуальная версия, иначе None"""
+        return self.conditional_response(request, self.get_validator_state(request, *args, **kwargs))
+
+    async def anot_modified(self, request, *args, **kwargs):
+        """Асинхронный not_modified для представлений под ASGI"""
+        return self.conditional_response(request, await self.aget_validator_state(request, *args, **kwargs))
+
+    def conditional_response(self, request, validator_state):
+        if validator_state is None:
+            return None
+
+        last_modified, state = validator_state
+        # Тело ответа зависит ещё от пользователя, URL и формата
+        state = (request.user.pk, request.get_full_path(), request.accepted_renderer.format, state)
+        self.etag = quote_etag(hashlib.md5(repr(state).encode()).hexdigest())
+        self.last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        return get_conditional_response(
+            request,
+            etag=self.etag,
+            last_modified=self.last_modified,
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag and response.status_code in (200, 304):
+            response.headers.setdefault('ETag', self.etag)
+            if self.last_modified:
+                response.headers.setdefault('Last-Modified', http_date(self.last_modified))
+        return response
+
+
+def sparse_columns(model, names, required=('id',)):
+    """Колонки модели для .only(): обязательные плюс запрошенные поля, которые есть в таблице"""
+    columns = set(required)
+    for name in names:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete:
+            columns.add(name)
+    return sorted(columns)
+
+
+class SparseFieldsViewMixin:
+    """
+    Ограничение полей ответа GET-запроса: ?fields=id,title,lessons.title и ?expand=lessons.
+
+    Без ?fields отдаются все поля, как раньше. С ?fields вложенные объекты
+    попадают в ответ, только если указаны в fields или в expand. Отобранные
+    поля передаются в сериализатор, а представление применяет их к .only().
+    """
+    expandable_fields = ()
+
+    def get_sparse_fields(self):
+        """Возвращает (поля, {вложенное поле: его поля}) или (None, {}), если ограничений нет"""
+        request = self.request
+        if (getattr(self, 'swagger_fake_view', False) or request is None
+                or request.method != 'GET' or 'fields' not in request.query_params):
+            return None, {}
+
+        fields, nested = set(), {}
+        for name in request.query_params['fields'].split(','):
+            name = name.strip()
+            if '.' in name:
+                parent, child = name.split('.', 1)
+                if parent in self.expandable_fields:
+                    fields.add(parent)
+                    nested.setdefault(parent, set()).add(child)
+            elif name:
+                fields.add(name)
+
+        for name in request.query_params.get('expand', '').split(','):
+            if name.strip() in self.expandable_fields:
+                fields.add(name.strip())
+        return fields, nested
+
+    def get_serializer(self, *args, **kwargs):
+        fields, nested = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('nested_fields', nested)
+        return super().get_serializer(*args, **kwargs)
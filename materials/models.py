@@ -1,4 +1,7 @@
-from django.db import models
+from django.db import connection, models
+from django.utils import timezone
+
+from materials.caching import bump_generation, user_generation
 
 
 class Course(models.Model):
@@ -15,6 +18,9 @@ class Course(models.Model):
     class Meta:
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='course_created_at_id_idx'),
+        ]
 
 
 class Lesson(models.Model):
@@ -24,6 +30,7 @@ class Lesson(models.Model):
     video_link = models.URLField(blank=True, null=True, verbose_name="Ссылка на видео")
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="lessons", verbose_name="Курс")
     owner = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Владелец")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
     def __str__(self):
         return self.title
@@ -33,11 +40,88 @@ class Lesson(models.Model):
         verbose_name_plural = "Уроки"
 
 
+class SubscriptionManager(models.Manager):
+    """
+    Подписки одним запросом без гонок на unique_together.
+
+    Методы обходят сигналы post_save/post_delete, поэтому поколение кэша ответов
+    пользователя сбрасывается здесь же.
+    """
+
+    def toggle(self, user_id, course_id):
+        """
+        Подписывает или отписывает пользователя одним атомарным запросом.
+
+        Возвращает True (подписка добавлена), False (удалена) или None, если
+        курса нет. Существующая подписка удаляется с RETURNING, иначе вставляется
+        строка из materials_course - так курс проверяется тем же запросом.
+        """
+        subscription_table = connection.ops.quote_name(self.model._meta.db_table)
+        course_table = connection.ops.quote_name(Course._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH deleted AS (
+                    DELETE FROM {subscription_table}
+                    WHERE user_id = %(user_id)s AND course_id = %(course_id)s
+                    RETURNING id
+                ), inserted AS (
+                    INSERT INTO {subscription_table} (user_id, course_id, subscribed_at)
+                    SELECT %(user_id)s, id, %(now)s FROM {course_table}
+                    WHERE id = %(course_id)s AND NOT EXISTS (SELECT 1 FROM deleted)
+                    ON CONFLICT (user_id, course_id) DO NOTHING
+                    RETURNING id
+                )
+                SELECT EXISTS (SELECT 1 FROM deleted),
+                       EXISTS (SELECT 1 FROM {course_table} WHERE id = %(course_id)s)
+                """,
+                {'user_id': user_id, 'course_id': course_id, 'now': timezone.now()},
+            )
+            deleted, course_exists = cursor.fetchone()
+
+        if deleted:
+            bump_generation(user_generation(user_id))
+            return False
+        if not course_exists:
+            return None
+        # При одновременной вставке ON CONFLICT оставляет одну подписку - результат тот же
+        bump_generation(user_generation(user_id))
+        return True
+
+    def subscribe_many(self, user_id, course_ids):
+        """Подписывает на существующие курсы из course_ids, возвращает их id"""
+        existing = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+        self.bulk_create(
+            [self.model(user_id=user_id, course_id=course_id) for course_id in sorted(existing)],
+            ignore_conflicts=True,
+        )
+        bump_generation(user_generation(user_id))
+        return existing
+
+    def unsubscribe_many(self, user_id, course_ids):
+        """Отписывает от курсов из course_ids, возвращает id курсов, от которых отписал"""
+        subscription_table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                DELETE FROM {subscription_table}
+                WHERE user_id = %s AND course_id = ANY(%s)
+                RETURNING course_id
+                """,
+                [user_id, list(course_ids)],
+            )
+            deleted = {course_id for course_id, in cursor.fetchall()}
+        bump_generation(user_generation(user_id))
+        return deleted
+
+
 class Subscription(models.Model):
     user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='subscriptions', verbose_name="Пользователь")
     course = models.ForeignKey('Course', on_delete=models.CASCADE, related_name='subscriptions', verbose_name="Курс")
     subscribed_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата подписки")
 
+    objects = SubscriptionManager()
+
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
@@ -45,3 +129,33 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f"{self.user.email} подписан на {self.course.title}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Задача Celery, записанная в той же транзакции, что и изменение данных.
+
+    Публикуется в брокер после фиксации транзакции (materials.outbox), поэтому
+    при откате задача не уходит, а запрос не ждёт брокер. processed_at
+    отмечает задача при первом запуске, повторно опубликованное сообщение
+    она пропускает (materials.outbox.claim_message).
+    """
+    task_name = models.CharField(max_length=255, verbose_name="Задача")
+    args = models.JSONField(default=list, blank=True, verbose_name="Аргументы")
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name="Именованные аргументы")
+    key = models.CharField(max_length=255, blank=True, verbose_name="Ключ события")
+    eta = models.DateTimeField(blank=True, null=True, verbose_name="Время выполнения")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    published_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата публикации")
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата обработки")
+
+    def __str__(self):
+        return f"{self.task_name} #{self.pk}"
+
+    class Meta:
+        verbose_name = "Сообщение outbox"
+        verbose_name_plural = "Сообщения outbox"
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(published_at__isnull=True), name='outbox_pending_idx'),
+            models.Index(fields=['key', 'eta'], name='outbox_key_eta_idx'),
+        ]
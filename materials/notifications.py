@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from materials.models import Course, OutboxMessage
+from materials.outbox import enqueue
+from materials.tasks import send_course_update_notification
+
+# Поля курса, которые видят подписчики; изменение остальных не вызывает уведомлений
+NOTIFY_FIELDS = ('title', 'description', 'preview')
+
+
+def visible_state(course):
+    return {field: getattr(course, field) for field in NOTIFY_FIELDS}
+
+
+def notify_course_updated(course_id):
+    """
+    Планирует одно уведомление подписчикам на окно COURSE_NOTIFICATION_WINDOW.
+
+    Первое изменение курса записывает в outbox задачу со временем выполнения
+    через окно, последующие в течение окна находят её и ничего не добавляют.
+    Задача читает курс при запуске, поэтому в письмо попадает последнее
+    состояние. Вызывать в транзакции изменения курса: строка курса
+    блокируется до её конца, поэтому одновременные изменения проверяют и
+    записывают outbox по очереди и не планируют два уведомления.
+    """
+    Course.objects.select_for_update().filter(pk=course_id).exists()
+    key = f'course-update:{course_id}'
+    now = timezone.now()
+    if OutboxMessage.objects.filter(key=key, eta__gt=now).exists():
+        return
+    enqueue(
+        send_course_update_notification,
+        args=(course_id,),
+        eta=now + timedelta(seconds=settings.COURSE_NOTIFICATION_WINDOW),
+        key=key,
+    )
@@ -0,0 +1,110 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from celery import signature
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from materials.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# id задачи Celery для сообщения: outbox-<id сообщения>
+TASK_ID_PREFIX = 'outbox-'
+
+# Один поток на процесс: публикации идут последовательно и не блокируют запросы
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outbox-relay')
+
+
+def enqueue(task, args=(), kwargs=None, eta=None, key=''):
+    """
+    Записывает задачу в outbox в текущей транзакции.
+
+    После фиксации транзакции запускается публикация; при откате запись
+    исчезает вместе с остальными изменениями.
+    """
+    message = OutboxMessage.objects.create(
+        task_name=task.name,
+        args=list(args),
+        kwargs=kwargs or {},
+        eta=eta,
+        key=key,
+    )
+    transaction.on_commit(schedule_relay)
+    return message
+
+
+def schedule_relay():
+    if settings.OUTBOX_RELAY_IN_THREAD:
+        _executor.submit(_relay_in_thread)
+    else:
+        publish_pending()
+
+
+def _relay_in_thread():
+    try:
+        publish_pending()
+    except Exception:
+        # Неопубликованные сообщения подберёт периодическая задача relay_outbox
+        logger.exception('Ошибка публикации outbox')
+    finally:
+        connection.close()
+
+
+def publish_pending(batch_size=None):
+    """
+    Публикует неопубликованные сообщения пакетами, возвращает их количество.
+
+    Пакет блокируется FOR UPDATE SKIP LOCKED, поэтому поток ретранслятора и
+    периодическая задача не публикуют одно сообщение дважды. Если брокер
+    недоступен, публикация останавливается на первой ошибке: уже принятые
+    брокером сообщения отмечаются опубликованными, остальные остаются в
+    outbox, затем ошибка выбрасывается. id задачи Celery постоянный
+    (outbox-<id>), по нему задача пропускает повторную публикацию.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    published = 0
+    while True:
+        error = None
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects.select_for_update(skip_locked=True)
+                .filter(published_at__isnull=True)
+                .order_by('id')[:batch_size]
+            )
+            sent_ids = []
+            for message in messages:
+                try:
+                    signature(message.task_name, args=message.args, kwargs=message.kwargs).apply_async(
+                        eta=message.eta,
+                        task_id=f'{TASK_ID_PREFIX}{message.pk}',
+                    )
+                except Exception as exc:
+                    error = exc
+                    break
+                sent_ids.append(message.pk)
+            if sent_ids:
+                OutboxMessage.objects.filter(pk__in=sent_ids).update(published_at=timezone.now())
+        published += len(sent_ids)
+        if error is not None:
+            raise error
+        if len(messages) < batch_size:
+            return published
+
+
+def claim_message(task_id):
+    """
+    Отмечает сообщение outbox задачи обработанным, возвращает False, если оно уже обработано.
+
+    Вызывается задачей при первом запуске (не при повторе после retry):
+    сообщение, опубликованное повторно после сбоя ретранслятора, приходит с
+    тем же task_id и пропускается. Задачи, запущенные не через outbox,
+    всегда выполняются.
+    """
+    if not task_id or not task_id.startswith(TASK_ID_PREFIX):
+        return True
+    return bool(
+        OutboxMessage.objects.filter(pk=task_id.removeprefix(TASK_ID_PREFIX), processed_at__isnull=True)
+        .update(processed_at=timezone.now())
+    )
@@ -1,11 +1,108 @@
-from rest_framework.pagination import PageNumberPagination
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
-class LessonPagination(PageNumberPagination):
+
+class CursorModeMixin:
+    """
+    Включает keyset-пагинацию по запросу клиента.
+
+    Режим курсора выбирается параметром ?pagination=cursor (первая страница)
+    или наличием ?cursor= (последующие страницы). В этом режиме нет COUNT(*)
+    и OFFSET, поэтому любая страница стоит столько же, сколько первая.
+    """
+    cursor_pagination_class = None
+    mode_query_param = 'pagination'
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        params = request.query_params
+        return (params.get(self.mode_query_param) == 'cursor'
+                or self.cursor_pagination_class.cursor_query_param in params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            page = self.cursor_paginator.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.cursor_paginator.display_page_controls
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset для асинхронных представлений: COUNT и страница читаются асинхронным ORM.
+
+        Страница курсора строится синхронным CursorPagination в потоке
+        (один запрос без COUNT).
+        """
+        if self.use_cursor(request):
+            return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count - cached_property, сам он посчитал бы синхронно
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        self.page.object_list = [obj async for obj in self.page.object_list.aiterator(chunk_size=page_size)]
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
+
+
+class LessonCursorPagination(CursorPagination):
+    """Курсор по уникальному id"""
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = 'id'
+
+
+class CourseCursorPagination(CursorPagination):
+    """
+    Курсор по дате создания, новые первыми.
+
+    CursorPagination строит позицию только по первому полю сортировки.
+    Курсы с одинаковым created_at не теряются и не повторяются: курсор хранит
+    смещение внутри группы равных значений, а -id делает порядок в группе
+    устойчивым. Большие группы равных значений читаются через OFFSET, но
+    auto_now_add почти не даёт совпадений.
+    """
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = ('-created_at', '-id')  # Индекс course_created_at_id_idx
+
+
+class LessonPagination(CursorModeMixin, PageNumberPagination):
     page_size = 5  # Количество по умолчанию
     page_size_query_param = 'page_size'
     max_page_size = 50  # Максимальное количество элементов на странице
+    cursor_pagination_class = LessonCursorPagination
+
 
-class CoursePagination(PageNumberPagination):
+class CoursePagination(CursorModeMixin, PageNumberPagination):
     page_size = 5  # Количество по умолчанию
     page_size_query_param = 'page_size'
     max_page_size = 50  # Максимальное количество элементов на странице
+    cursor_pagination_class = CourseCursorPagination
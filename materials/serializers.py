@@ -1,13 +1,41 @@
 from rest_framework import serializers
 
+from materials.fast_serializers import FastListSerializer
 from materials.models import Course, Lesson, Subscription
 from materials.validators import validate_youtube_url
 
 
-class LessonSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Сериализатор с ограниченным набором полей.
+
+    fields - имена полей верхнего уровня, nested_fields - поля вложенных
+    сериализаторов: {'lessons': {'id', 'title'}}.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        nested_fields = kwargs.pop('nested_fields', None) or {}
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            self._restrict(self, fields)
+        for name, child_fields in nested_fields.items():
+            if name in self.fields:
+                field = self.fields[name]
+                self._restrict(getattr(field, 'child', field), child_fields)
+
+    @staticmethod
+    def _restrict(serializer, fields):
+        for name in set(serializer.fields) - set(fields):
+            serializer.fields.pop(name)
+
+
+class LessonSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Lesson
         fields = "__all__"
+        list_serializer_class = FastListSerializer
         extra_kwargs = {
             'video_link': {'validators': [validate_youtube_url]}
         }
@@ -20,17 +48,35 @@ class LessonSerializer(serializers.ModelSerializer):
         return value
 
 
-class CourseSerializer(serializers.ModelSerializer):
-    lessons_count = serializers.SerializerMethodField()
-    lessons = LessonSerializer(many=True, read_only=True, source='lessons.all')
-    owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Связь по pk, проверяемая по объектам из context['preloaded'][модель].
 
-    class Meta:
-        model = Course
-        fields = ["id", "title", "preview", "description", "lessons_count", "lessons", "owner"]
+    Для массовых операций: объекты загружаются одним запросом на весь пакет,
+    а не по запросу на каждый элемент. Без context['preloaded'] работает как обычно.
+    """
 
-    def get_lessons_count(self, obj):
-        return obj.lessons.count()
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.get_queryset().model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return preloaded[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class LessonBulkItemSerializer(LessonSerializer):
+    """Элемент массового создания/обновления уроков: с id - обновление, без id - создание"""
+    id = serializers.IntegerField(required=False, min_value=1)
+    course = PreloadedPrimaryKeyRelatedField(queryset=Course.objects.all())
+
+    class Meta(LessonSerializer.Meta):
+        read_only_fields = ('owner', 'updated_at')
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -39,7 +85,21 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class SubscriptionBulkSerializer(serializers.Serializer):
+    ACTION_CHOICES = [
+        ('subscribe', 'Подписаться'),
+        ('unsubscribe', 'Отписаться'),
+    ]
+
+    action = serializers.ChoiceField(choices=ACTION_CHOICES)
+    course_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     lessons_count = serializers.SerializerMethodField()
     lessons = LessonSerializer(many=True, read_only=True, source='lessons.all')
     owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
@@ -48,11 +108,17 @@ class CourseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
         fields = ["id", "title", "preview", "description", "lessons_count", "lessons", "owner", "is_subscribed"]
+        list_serializer_class = FastListSerializer
 
     def get_lessons_count(self, obj):
+        # Значение может быть уже посчитано в queryset (см. CourseViewSet.get_queryset)
+        if hasattr(obj, 'lessons_count'):
+            return obj.lessons_count
         return obj.lessons.count()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Subscription.objects.filter(user=request.user, course=obj).exists()
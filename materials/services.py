@@ -1,63 +1,269 @@
+import logging
+import random
+import threading
+import time
+import uuid
+
+import requests
 import stripe
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+logger = logging.getLogger(__name__)
 
+_client = None
+_client_lock = threading.Lock()
 
-def create_stripe_product(name, description=None):
-    """Создание продукта в Stripe"""
-    try:
-        product = stripe.Product.create(
-            name=name,
-            description=description,
-        )
-        return product
-    except stripe.error.StripeError as e:
-        print(f"Ошибка при создании продукта: {e}")
+
+class CircuitBreaker:
+    """
+    Предохранитель для вызовов Stripe.
+
+    После failure_threshold сбоев подряд (сеть, таймауты, 429 и 5xx) вызовы
+    отклоняются сразу в течение reset_timeout секунд; затем пропускается
+    один пробный вызов, и его успех снова замыкает цепь.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning('Stripe недоступен, вызовы приостановлены на %s с', self.reset_timeout)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def configure(self, failure_threshold, reset_timeout):
+        """Новые пороги и замкнутая цепь"""
+        with self._lock:
+            self.failure_threshold = failure_threshold
+            self.reset_timeout = reset_timeout
+            self.state = self.CLOSED
+            self.failures = 0
+
+
+breaker = CircuitBreaker(
+    failure_threshold=settings.STRIPE_BREAKER_THRESHOLD,
+    reset_timeout=settings.STRIPE_BREAKER_RESET_TIMEOUT,
+)
+
+
+def get_client():
+    """
+    Клиент Stripe с пулом keep-alive соединений и таймаутами.
+
+    Создаётся при первом вызове в процессе (после fork воркера), поэтому
+    соединения не разделяются между процессами.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                http_client = stripe.RequestsClient(
+                    session=session,
+                    timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+                )
+                _client = stripe.StripeClient(
+                    settings.STRIPE_SECRET_KEY or '',
+                    http_client=http_client,
+                    # Локальный адрес для тестов с поддельным сервером Stripe
+                    base_addresses={'api': settings.STRIPE_API_BASE} if settings.STRIPE_API_BASE else {},
+                    max_network_retries=0,
+                )
+    return _client
+
+
+def reset_client():
+    """
+    Сбрасывает клиент и предохранитель (после смены настроек).
+
+    Клиент создаётся заново при следующем вызове, пороги предохранителя
+    перечитываются из STRIPE_BREAKER_THRESHOLD и STRIPE_BREAKER_RESET_TIMEOUT.
+    Объект breaker тот же, ссылки на него из других модулей остаются верными.
+    """
+    global _client
+    with _client_lock:
+        _client = None
+    breaker.configure(settings.STRIPE_BREAKER_THRESHOLD, settings.STRIPE_BREAKER_RESET_TIMEOUT)
+
+
+def _is_retryable(error):
+    if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+        return True
+    return isinstance(error, stripe.error.APIError) and (error.http_status or 500) >= 500
+
+
+def _backoff(attempt):
+    # Экспоненциальная задержка с полным джиттером
+    return random.uniform(0, min(settings.STRIPE_RETRY_MAX_DELAY, settings.STRIPE_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _log_call(operation, outcome, attempts, started):
+    """
+    Одна строка лога на вызов: операция, исход (ok, error, rejected, exception), попытки и время.
+
+    Поля продублированы в extra (stripe_operation, stripe_outcome,
+    stripe_attempts, stripe_elapsed), по ним считаются метрики в сборщике логов.
+    """
+    elapsed = time.monotonic() - started
+    logger.log(
+        logging.INFO if outcome == 'ok' else logging.WARNING,
+        'Stripe %s: %s, попыток %s, %.3f с', operation, outcome, attempts, elapsed,
+        extra={
+            'stripe_operation': operation,
+            'stripe_outcome': outcome,
+            'stripe_attempts': attempts,
+            'stripe_elapsed': round(elapsed, 3),
+        },
+    )
+
+
+def call_stripe(operation, method, params=None, idempotent=False):
+    """
+    Вызов метода клиента Stripe с повторами, предохранителем и строкой лога на вызов.
+
+    Повторяются только идемпотентные вызовы (чтение и создание с
+    Idempotency-Key) и только при временных сбоях. Возвращает результат или
+    None при ошибке Stripe и при разомкнутом предохранителе; прочие
+    исключения считаются сбоем и выбрасываются дальше.
+    """
+    started = time.monotonic()
+    if not breaker.allow():
+        _log_call(operation, 'rejected', 0, started)
         return None
 
+    attempts = settings.STRIPE_MAX_RETRIES + 1 if idempotent else 1
+    for attempt in range(attempts):
+        attempt_started = time.monotonic()
+        try:
+            result = method(params or {})
+        except stripe.error.StripeError as e:
+            retryable = _is_retryable(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                # Stripe ответил (ошибка запроса), сервис доступен
+                breaker.record_success()
+            logger.warning('Stripe %s: ошибка за %.3f с (попытка %s): %s',
+                           operation, time.monotonic() - attempt_started, attempt + 1, e)
+            if not retryable or attempt + 1 == attempts or not breaker.allow():
+                _log_call(operation, 'error', attempt + 1, started)
+                return None
+            time.sleep(_backoff(attempt))
+        except Exception:
+            # Не ошибка Stripe (клиент, разбор ответа): исход всё равно записывается,
+            # иначе пробный вызов оставил бы предохранитель полуоткрытым навсегда
+            breaker.record_failure()
+            logger.exception('Stripe %s: непредвиденная ошибка (попытка %s)', operation, attempt + 1)
+            _log_call(operation, 'exception', attempt + 1, started)
+            raise
+        else:
+            breaker.record_success()
+            _log_call(operation, 'ok', attempt + 1, started)
+            return result
+    return None
+
+
+def _create_options(idempotency_key=None):
+    # Один ключ на все попытки: повтор создания не создаёт дубликат
+    return {'idempotency_key': idempotency_key or str(uuid.uuid4())}
+
+
+def create_stripe_product(name, description=None, idempotency_key=None):
+    """Создание продукта в Stripe"""
+    params = {'name': name}
+    if description:
+        params['description'] = description
+    options = _create_options(idempotency_key)
+    return call_stripe(
+        'product.create', lambda p: get_client().products.create(p, options), params, idempotent=True
+    )
 
-def create_stripe_price(product_id, amount, currency="rub"):
+
+def create_stripe_price(product_id, amount, currency="rub", idempotency_key=None):
     """Создание цены в Stripe"""
-    try:
-        # Конвертируем в копейки (центы)
-        unit_amount = int(amount * 100)
-
-        price = stripe.Price.create(
-            product=product_id,
-            unit_amount=unit_amount,
-            currency=currency,
-        )
-        return price
-    except stripe.error.StripeError as e:
-        print(f"Ошибка при создании цены: {e}")
-        return None
+    # Конвертируем в копейки (центы)
+    unit_amount = int(amount * 100)
+    options = _create_options(idempotency_key)
+    return call_stripe(
+        'price.create',
+        lambda p: get_client().prices.create(p, options),
+        {'product': product_id, 'unit_amount': unit_amount, 'currency': currency},
+        idempotent=True,
+    )
 
 
 def create_stripe_checkout_session(price_id, success_url, cancel_url):
     """Создание сессии для оплаты в Stripe"""
-    try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
+    options = _create_options()
+    return call_stripe(
+        'checkout_session.create',
+        lambda p: get_client().checkout.sessions.create(p, options),
+        {
+            'payment_method_types': ['card'],
+            'line_items': [{
                 'price': price_id,
                 'quantity': 1,
             }],
-            mode='payment',
-            success_url=success_url,
-            cancel_url=cancel_url,
-        )
-        return session
-    except stripe.error.StripeError as e:
-        print(f"Ошибка при создании сессии: {e}")
-        return None
+            'mode': 'payment',
+            'success_url': success_url,
+            'cancel_url': cancel_url,
+        },
+        idempotent=True,
+    )
 
 
 def get_stripe_session_status(session_id):
     """Получение статуса сессии оплаты"""
-    try:
-        session = stripe.checkout.Session.retrieve(session_id)
-        return session
-    except stripe.error.StripeError as e:
-        print(f"Ошибка при получении статуса сессии: {e}")
-        return None
+    return call_stripe(
+        'checkout_session.retrieve',
+        lambda p: get_client().checkout.sessions.retrieve(session_id, p),
+        idempotent=True,
+    )
+
+
+def iter_checkout_sessions(created_gte, page_size=100):
+    """
+    Сессии Checkout, созданные не раньше created_gte (timestamp), страницами по page_size.
+
+    Выдаёт списки сессий; если страницу получить не удалось, выдаёт None и
+    останавливается.
+    """
+    params = {'created': {'gte': created_gte}, 'limit': page_size}
+    while True:
+        page = call_stripe(
+            'checkout_session.list', lambda p: get_client().checkout.sessions.list(p), params, idempotent=True
+        )
+        if page is None:
+            yield None
+            return
+        sessions = page['data']
+        yield sessions
+        if not page['has_more'] or not sessions:
+            return
+        params = {**params, 'starting_after': sessions[-1]['id']}
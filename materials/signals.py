@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from materials.caching import GLOBAL_GENERATION, bump_generation, user_generation
+from materials.models import Course, Lesson, Subscription
+
+
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Lesson)
+def invalidate_course_responses(sender, instance, **kwargs):
+    """Изменение курса или урока сбрасывает кэш ответов курсов для всех пользователей"""
+    bump_generation(GLOBAL_GENERATION)
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_subscriber_responses(sender, instance, **kwargs):
+    """Подписка меняет только is_subscribed, поэтому сбрасывается кэш одного пользователя"""
+    bump_generation(user_generation(instance.user_id))
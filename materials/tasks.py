@@ -1,50 +1,121 @@
-from celery import shared_task
-from django.core.mail import send_mail
+from datetime import timedelta
+
+from celery import group, shared_task
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.html import strip_tags
 
-from materials.models import Course, Subscription
+from materials.models import Course, OutboxMessage, Subscription
+from materials.outbox import claim_message
 
+User = get_user_model()
 
-@shared_task
-def send_course_update_notification(course_id):
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=60)
+def send_course_update_notification(self, course_id):
     """
-    Асинхронная задача для отправки уведомлений об обновлении курса
+    Асинхронная задача для отправки уведомлений об обновлении курса.
+
+    Подписчики делятся на пакеты по NOTIFICATION_BATCH_SIZE, каждый пакет
+    отправляется отдельной задачей send_course_update_batch (группа Celery).
+    Если группу не удалось поставить в очередь, задача повторяется.
+    Повторно опубликованное сообщение outbox пропускается.
     """
+    if not self.request.retries and not claim_message(self.request.id):
+        return f"Уведомление {self.request.id} уже обработано"
+
     try:
-        course = Course.objects.get(id=course_id)
-        subscriptions = Subscription.objects.filter(course=course)
+        course = Course.objects.only('title').get(id=course_id)
+    except Course.DoesNotExist:
+        return f"Курс с идентификатором {course_id} не существует"
 
-        if not subscriptions.exists():
-            return f"Нет подписчиков на курс {course.title}"
+    subscriber_ids = list(
+        Subscription.objects.filter(course_id=course_id)
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+    )
 
-        subject = f'Обновление курса: {course.title}'
+    if not subscriber_ids:
+        return f"Нет подписчиков на курс {course.title}"
 
-        for subscription in subscriptions:
-            user = subscription.user
-            context = {
-                'course_title': course.title,
-                'user_name': user.first_name or user.email,
-                'course_description': course.description,
-            }
+    batch_size = settings.NOTIFICATION_BATCH_SIZE
+    try:
+        group(
+            send_course_update_batch.s(course_id, subscriber_ids[start:start + batch_size])
+            for start in range(0, len(subscriber_ids), batch_size)
+        ).apply_async()
+    except Exception as exc:
+        raise self.retry(exc=exc)
 
-            # HTML версия письма
-            html_message = render_to_string('materials/course_update_email.html', context)
-            plain_message = strip_tags(html_message)
+    return f"Поставлено в очередь уведомлений {len(subscriber_ids)} для курса {course.title}"
 
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
 
-        return f"Отправленных уведомлений {subscriptions.count()} для курса {course.title}"
+@shared_task(bind=True, max_retries=5, default_retry_delay=60)
+def send_course_update_batch(self, course_id, user_ids):
+    """
+    Отправка уведомлений об обновлении курса пакету подписчиков.
 
+    Все письма пакета отправляются через одно SMTP-соединение. При ошибке
+    задача повторяется только для ещё не получивших письмо пользователей.
+    """
+    try:
+        course = Course.objects.only('title', 'description').get(id=course_id)
     except Course.DoesNotExist:
         return f"Курс с идентификатором {course_id} не существует"
-    except Exception as e:
-        return f"Ошибка при отправке уведомлений: {str(e)}"
\ No newline at end of file
+
+    recipients = (
+        User.objects.filter(pk__in=user_ids, is_active=True)
+        .order_by('pk')
+        .values_list('pk', 'email', 'first_name')
+    )
+    subject = f'Обновление курса: {course.title}'
+
+    sent_ids = []
+    try:
+        with get_connection() as connection:
+            for user_id, email, first_name in recipients:
+                context = {
+                    'course_title': course.title,
+                    'user_name': first_name or email,
+                    'course_description': course.description,
+                }
+
+                # HTML версия письма
+                html_message = render_to_string('materials/course_update_email.html', context)
+                message = EmailMultiAlternatives(
+                    subject=subject,
+                    body=strip_tags(html_message),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[email],
+                    connection=connection,
+                )
+                message.attach_alternative(html_message, 'text/html')
+                connection.send_messages([message])
+                sent_ids.append(user_id)
+    except Exception as exc:
+        sent = set(sent_ids)
+        remaining = [user_id for user_id in user_ids if user_id not in sent]
+        raise self.retry(args=(course_id, remaining), exc=exc)
+
+    return f"Отправленных уведомлений {len(sent_ids)} для курса {course.title}"
+
+
+@shared_task
+def relay_outbox():
+    """
+    Периодическая публикация outbox.
+
+    Подбирает сообщения, которые не опубликовал ретранслятор после фиксации
+    транзакции (брокер был недоступен, процесс остановился), и удаляет
+    опубликованные старше OUTBOX_RETENTION_DAYS.
+    """
+    from materials.outbox import publish_pending
+
+    published = publish_pending()
+    deleted, _ = OutboxMessage.objects.filter(
+        published_at__lt=timezone.now() - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    ).delete()
+    return f"Опубликовано сообщений outbox: {published}, удалено старых: {deleted}"
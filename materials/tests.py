@@ -1,8 +1,37 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from smtplib import SMTPException
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from celery import group
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection, transaction
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework import status
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from django.utils.http import http_date
+from kombu.exceptions import OperationalError
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
 
-from materials.models import Course, Lesson, Subscription
+from config.celery import app as celery_app
+from materials.models import Course, Lesson, OutboxMessage, Subscription
+from materials.notifications import notify_course_updated
+from materials import services
+from materials.serializers import CourseSerializer, LessonSerializer
+from materials.tasks import relay_outbox, send_course_update_notification
+from materials.views import AsyncCourseViewSet, AsyncLessonListAPIView, CourseViewSet, LessonListAPIView
 from users.models import User
 
 
@@ -222,3 +251,988 @@ class SubscriptionTestCase(APITestCase):
         self.assertTrue(
             response.data['is_subscribed']
         )
+
+    def test_toggle_single_query(self):
+        """Тест переключения подписки одним запросом и ответа 404 для несуществующего курса"""
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                reverse('materials:subscription'),
+                data={'course_id': self.course.id}
+            )
+        self.assertEqual(response.data['message'], 'Подписка добавлена')
+
+        response = self.client.post(
+            reverse('materials:subscription'),
+            data={'course_id': self.course.id + 100}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Subscription.objects.count(), 1)
+
+    def test_toggle_invalidates_cached_course(self):
+        """Тест сброса кэша ответа курса после переключения подписки"""
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+        url = reverse('materials:course-detail', kwargs={'pk': self.course.id})
+        self.assertFalse(self.client.get(url).data['is_subscribed'])
+
+        self.client.post(reverse('materials:subscription'), data={'course_id': self.course.id})
+        self.assertTrue(self.client.get(url).data['is_subscribed'])
+
+    def test_bulk_subscribe_unsubscribe(self):
+        """Тест массовой подписки и отписки"""
+        other = Course.objects.create(title='Other', description='Test', owner=self.user)
+        Subscription.objects.create(user=self.user, course=self.course)
+        self.client.force_authenticate(user=self.user)
+        url = reverse('materials:subscription-bulk')
+
+        response = self.client.post(url, data={
+            'action': 'subscribe', 'course_ids': [self.course.id, other.id, other.id + 100]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['course_ids'], [self.course.id, other.id])
+        self.assertEqual(response.data['not_found'], [other.id + 100])
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 2)
+
+        response = self.client.post(url, data={
+            'action': 'unsubscribe', 'course_ids': [other.id, other.id + 100]
+        }, format='json')
+        self.assertEqual(response.data['course_ids'], [other.id])
+        self.assertEqual(list(Subscription.objects.values_list('course_id', flat=True)), [self.course.id])
+
+        response = self.client.post(url, data={'action': 'subscribe', 'course_ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CourseQueryCountTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.user.set_password('test')
+        self.user.save()
+
+        for i in range(5):
+            course = Course.objects.create(
+                title=f'Course {i}',
+                description='Test Description',
+                owner=self.user
+            )
+            for j in range(3):
+                Lesson.objects.create(
+                    title=f'Lesson {i}.{j}',
+                    course=course,
+                    owner=self.user
+                )
+            if i % 2 == 0:
+                Subscription.objects.create(user=self.user, course=course)
+
+    def test_course_list_query_count(self):
+        """Тест фиксированного количества запросов при получении списка курсов"""
+        self.client.force_authenticate(user=self.user)
+        # Проверка модератора, агрегат для ETag, count пагинации, курсы, уроки
+        with self.assertNumQueries(5):
+            response = self.client.get(
+                reverse('materials:course-list')
+            )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        results = response.data['results']
+        self.assertEqual(len(results), 5)
+        for course in results:
+            self.assertEqual(course['lessons_count'], 3)
+            self.assertEqual(len(course['lessons']), 3)
+        self.assertEqual(
+            sum(course['is_subscribed'] for course in results),
+            3
+        )
+
+    def test_course_retrieve_query_count(self):
+        """Тест фиксированного количества запросов при получении курса"""
+        course = Course.objects.filter(subscriptions__user=self.user).first()
+        self.client.force_authenticate(user=self.user)
+        # Проверка модератора, агрегат для ETag, курс, уроки
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                reverse('materials:course-detail', kwargs={'pk': course.id})
+            )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertEqual(response.data['lessons_count'], 3)
+        self.assertTrue(response.data['is_subscribed'])
+
+
+class CursorPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.user.set_password('test')
+        self.user.save()
+
+        self.course = Course.objects.create(
+            title='Test Course',
+            owner=self.user
+        )
+        for i in range(7):
+            Lesson.objects.create(
+                title=f'Lesson {i}',
+                course=self.course,
+                owner=self.user
+            )
+
+    def test_lesson_list_cursor(self):
+        """Тест прохода по всем урокам в режиме курсора"""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(
+            reverse('materials:lesson-list'),
+            {'pagination': 'cursor'}
+        )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertNotIn('count', response.data)
+        ids = [lesson['id'] for lesson in response.data['results']]
+        self.assertEqual(len(ids), 5)
+
+        response = self.client.get(response.data['next'])
+        ids += [lesson['id'] for lesson in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            ids,
+            list(Lesson.objects.order_by('id').values_list('id', flat=True))
+        )
+
+    def test_lesson_list_page_number_by_default(self):
+        """Тест сохранения постраничной пагинации по умолчанию"""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(
+            reverse('materials:lesson-list')
+        )
+        self.assertEqual(response.data['count'], 7)
+
+    def test_course_list_cursor(self):
+        """Тест режима курсора для списка курсов"""
+        Course.objects.create(title='Second Course', owner=self.user)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(
+            reverse('materials:course-list'),
+            {'pagination': 'cursor', 'page_size': 1}
+        )
+        self.assertEqual(response.data['results'][0]['title'], 'Second Course')
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['title'], 'Test Course')
+        self.assertIsNone(response.data['next'])
+
+    def test_course_list_cursor_ties(self):
+        """Тест курсора при одинаковом created_at: без пропусков и повторов в обе стороны"""
+        for i in range(6):
+            Course.objects.create(title=f'Course {i}', owner=self.user)
+        created_at = timezone.now()
+        # Группа из пяти одинаковых значений больше страницы и пересекает её границы
+        Course.objects.exclude(title__in=['Course 4', 'Course 5']).update(created_at=created_at)
+        expected = list(Course.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('materials:course-list'), {'pagination': 'cursor', 'page_size': 2})
+        ids = [course['id'] for course in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [course['id'] for course in response.data['results']]
+        self.assertEqual(ids, expected)
+
+        previous_ids = []
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            previous_ids = [course['id'] for course in response.data['results']] + previous_ids
+        self.assertEqual(previous_ids, expected[:len(previous_ids)])
+        self.assertEqual(len(previous_ids) + 1, len(expected))
+
+
+class CourseResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.user.set_password('test')
+        self.user.save()
+
+        self.course = Course.objects.create(
+            title='Test Course',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            title='Test Lesson',
+            course=self.course,
+            owner=self.user
+        )
+        self.url = reverse('materials:course-detail', kwargs={'pk': self.course.id})
+
+    def test_cached_retrieve_skips_queryset(self):
+        """Тест повторного чтения курса из кэша"""
+        self.client.force_authenticate(user=self.user)
+        self.client.get(self.url)
+        # Роль модератора уже в кэше, остаётся только агрегат для ETag
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertEqual(response.data['title'], 'Test Course')
+
+    def test_lesson_change_invalidates_course(self):
+        """Тест инвалидации кэша при изменении урока"""
+        self.client.force_authenticate(user=self.user)
+        self.client.get(self.url)
+
+        self.lesson.title = 'Updated Lesson'
+        self.lesson.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['lessons'][0]['title'], 'Updated Lesson')
+
+        self.lesson.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['lessons_count'], 0)
+
+    def test_subscription_invalidates_only_subscriber(self):
+        """Тест инвалидации is_subscribed при подписке"""
+        self.client.force_authenticate(user=self.user)
+        list_url = reverse('materials:course-list')
+        response = self.client.get(list_url)
+        self.assertFalse(response.data['results'][0]['is_subscribed'])
+
+        self.client.post(
+            reverse('materials:subscription'),
+            data={'course_id': self.course.id}
+        )
+        response = self.client.get(list_url)
+        self.assertTrue(response.data['results'][0]['is_subscribed'])
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.user.set_password('test')
+        self.user.save()
+
+        self.course = Course.objects.create(
+            title='Test Course',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            title='Test Lesson',
+            course=self.course,
+            owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def assertNotModified(self, url, last_modified=False):
+        response = self.client.get(url)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        # Last-Modified только у одного объекта, у агрегатов - только ETag
+        self.assertEqual('Last-Modified' in response.headers, last_modified)
+        etag = response.headers['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+        self.assertEqual(response.headers['ETag'], etag)
+        return etag
+
+    def test_course_not_modified(self):
+        """Тест ответа 304 для курса и списка курсов"""
+        self.assertNotModified(reverse('materials:course-detail', kwargs={'pk': self.course.id}))
+        self.assertNotModified(reverse('materials:course-list'))
+
+    def test_lesson_change_updates_course_etag(self):
+        """Тест смены ETag курса при изменении урока"""
+        url = reverse('materials:course-detail', kwargs={'pk': self.course.id})
+        etag = self.assertNotModified(url)
+
+        self.lesson.title = 'Updated Lesson'
+        self.lesson.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_subscription_updates_course_etag(self):
+        """Тест смены ETag курса при подписке"""
+        url = reverse('materials:course-detail', kwargs={'pk': self.course.id})
+        etag = self.assertNotModified(url)
+
+        Subscription.objects.create(user=self.user, course=self.course)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertTrue(response.data['is_subscribed'])
+
+    def test_lesson_not_modified(self):
+        """Тест ответа 304 для урока и списка уроков"""
+        self.assertNotModified(reverse('materials:lesson-get', kwargs={'pk': self.lesson.id}), last_modified=True)
+        etag = self.assertNotModified(reverse('materials:lesson-list'))
+
+        self.lesson.delete()
+        response = self.client.get(reverse('materials:lesson-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+
+    def test_if_modified_since_single_lesson(self):
+        """Тест 304 по If-Modified-Since для урока и 200 после его изменения"""
+        url = reverse('materials:lesson-get', kwargs={'pk': self.lesson.id})
+        last_modified = self.client.get(url).headers['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Lesson.objects.filter(pk=self.lesson.pk).update(updated_at=timezone.now() + timedelta(seconds=2))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since_after_unsubscribe(self):
+        """Тест отсутствия 304 по If-Modified-Since для курса после отписки"""
+        Subscription.objects.create(user=self.user, course=self.course)
+        url = reverse('materials:course-detail', kwargs={'pk': self.course.id})
+        response = self.client.get(url)
+        self.assertTrue(response.data['is_subscribed'])
+        since = http_date(time.time() + 60)
+
+        Subscription.objects.filter(user=self.user, course=self.course).delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['is_subscribed'])
+
+    def test_if_modified_since_after_lesson_delete(self):
+        """Тест отсутствия 304 по If-Modified-Since для списка уроков после удаления старого урока"""
+        Lesson.objects.create(title='New Lesson', course=self.course, owner=self.user)
+        url = reverse('materials:lesson-list')
+        self.assertEqual(self.client.get(url).data['count'], 2)
+        since = http_date(time.time() + 60)
+
+        self.lesson.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+
+class SparseFieldsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.user.set_password('test')
+        self.user.save()
+
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            title='Test Lesson',
+            description='Test Lesson Description',
+            course=self.course,
+            owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_course_list_fields(self):
+        """Тест ограничения полей курса без загрузки описания и уроков"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('materials:course-list'),
+                {'fields': 'id,title'}
+            )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('"materials_course"."description"', sql)
+        self.assertNotIn('"materials_lesson"."title"', sql)
+
+    def test_course_expand_lessons(self):
+        """Тест вложенных полей уроков через expand и lessons.<поле>"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('materials:course-detail', kwargs={'pk': self.course.id}),
+                {'fields': 'title,lessons.title', 'expand': 'lessons'}
+            )
+        self.assertEqual(set(response.data), {'title', 'lessons'})
+        self.assertEqual(response.data['lessons'], [{'title': 'Test Lesson'}])
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('"materials_lesson"."description"', sql)
+
+        response = self.client.get(
+            reverse('materials:course-detail', kwargs={'pk': self.course.id}),
+            {'fields': 'id', 'expand': 'lessons'}
+        )
+        self.assertIn('description', response.data['lessons'][0])
+
+    def test_lesson_fields(self):
+        """Тест ограничения полей урока"""
+        response = self.client.get(
+            reverse('materials:lesson-list'),
+            {'fields': 'id,title'}
+        )
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+        response = self.client.get(
+            reverse('materials:lesson-get', kwargs={'pk': self.lesson.id}),
+            {'fields': 'title'}
+        )
+        self.assertEqual(response.data, {'title': 'Test Lesson'})
+
+
+class FastListSerializerTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            preview='courses/previews/course.png',
+            owner=self.user
+        )
+        Course.objects.create(title='Empty Course')
+        Lesson.objects.create(
+            title='Test Lesson',
+            description='Test Lesson Description',
+            preview='lessons/previews/урок 1.png',
+            video_link='https://www.youtube.com/watch?v=test',
+            course=self.course,
+            owner=self.user
+        )
+        Lesson.objects.create(
+            title='Lesson without extras',
+            course=self.course
+        )
+        Subscription.objects.create(user=self.user, course=self.course)
+
+        request = APIRequestFactory().get('/')
+        request.user = self.user
+        self.context = {'request': request}
+
+    def render(self, serializer_class, data):
+        return JSONRenderer().render(serializer_class(data, many=True, context=self.context).data)
+
+    def test_lessons_identical(self):
+        """Тест побайтного совпадения быстрого пути для уроков и строк .values()"""
+        with override_settings(FAST_READ_SERIALIZERS=False):
+            expected = self.render(LessonSerializer, Lesson.objects.order_by('id'))
+
+        self.assertEqual(self.render(LessonSerializer, Lesson.objects.order_by('id')), expected)
+        self.assertEqual(self.render(LessonSerializer, Lesson.objects.order_by('id').values()), expected)
+
+    def test_courses_identical(self):
+        """Тест побайтного совпадения быстрого пути для курсов с вложенными уроками"""
+        with override_settings(FAST_READ_SERIALIZERS=False):
+            expected = self.render(CourseSerializer, Course.objects.order_by('id'))
+
+        self.assertEqual(self.render(CourseSerializer, Course.objects.order_by('id')), expected)
+        self.assertIn(b'"is_subscribed":true', expected)
+
+    def test_datetime_without_format(self):
+        """Тест DateTimeField(format=None) и DATETIME_FORMAT=None: значение как у to_representation поля"""
+        class RawDateLessonSerializer(LessonSerializer):
+            updated_at = serializers.DateTimeField(format=None, read_only=True)
+
+        lessons = Lesson.objects.order_by('id')
+        data = RawDateLessonSerializer(lessons, many=True, context=self.context).data
+        self.assertEqual([item['updated_at'] for item in data], [lesson.updated_at for lesson in lessons])
+
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DATETIME_FORMAT': None}):
+            data = LessonSerializer(lessons, many=True, context=self.context).data
+        self.assertEqual([item['updated_at'] for item in data], [lesson.updated_at for lesson in lessons])
+
+
+class LessonBulkTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.other = User.objects.create(
+            email='other@test.com'
+        )
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            title='Test Lesson',
+            course=self.course,
+            owner=self.user
+        )
+        self.url = reverse('materials:lesson-bulk')
+
+    def test_bulk_create_constant_queries(self):
+        """Тест импорта 500 уроков фиксированным числом запросов"""
+        self.client.force_authenticate(user=self.user)
+        data = [
+            {'title': f'Lesson {i}', 'course': self.course.id, 'video_link': 'https://youtube.com/watch?v=1'}
+            for i in range(500)
+        ]
+        # Курсы, роль, транзакция (2) и одна вставка; уроки без id не загружаются
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 500)
+        self.assertEqual(Lesson.objects.filter(owner=self.user).count(), 501)
+
+    def test_bulk_update(self):
+        """Тест массового обновления вместе с созданием"""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(self.url, [
+            {'id': self.lesson.id, 'title': 'Renamed'},
+            {'title': 'New', 'course': self.course.id},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['title'] for item in response.data], ['Renamed', 'New'])
+
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.title, 'Renamed')
+        self.assertGreater(self.lesson.updated_at, self.lesson.course.updated_at)
+
+    def test_per_item_errors(self):
+        """Тест ошибок по позициям без частичной записи"""
+        self.client.force_authenticate(user=self.other)
+        response = self.client.post(self.url, [
+            {'title': 'Valid', 'course': self.course.id},
+            {'title': 'Bad link', 'course': self.course.id, 'video_link': 'https://example.com/video'},
+            {'title': 'No course', 'course': self.course.id + 100},
+            {'id': self.lesson.id, 'title': 'Not mine'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('video_link', response.data[1])
+        self.assertIn('course', response.data[2])
+        self.assertIn('id', response.data[3])
+        self.assertEqual(Lesson.objects.count(), 1)
+
+
+@override_settings(NOTIFICATION_BATCH_SIZE=2)
+class CourseNotificationTestCase(APITestCase):
+    def setUp(self):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description'
+        )
+        for i in range(5):
+            user = User.objects.create(email=f'user{i}@test.com', first_name=f'User {i}')
+            Subscription.objects.create(user=user, course=self.course)
+
+    def test_batches_share_connection(self):
+        """Тест отправки пакетами с одним SMTP-соединением на пакет"""
+        with mock.patch('materials.tasks.get_connection', wraps=get_connection) as connections:
+            send_course_update_notification(self.course.id)
+        self.assertEqual(connections.call_count, 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'user{i}@test.com' for i in range(5)])
+        self.assertIn('User 0', mail.outbox[0].alternatives[0][0])
+
+    def test_retry_only_remaining_recipients(self):
+        """Тест повтора пакета без повторной отправки уже полученных писем"""
+        send_messages = EmailBackend.send_messages
+        failed = []
+
+        def flaky_send_messages(backend, messages):
+            if messages[0].to == ['user1@test.com'] and not failed:
+                failed.append(messages[0])
+                raise SMTPException('Connection lost')
+            return send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', flaky_send_messages):
+            send_course_update_notification(self.course.id)
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'user{i}@test.com' for i in range(5)])
+
+    def test_fan_out_error_retried(self):
+        """Тест повтора задачи, если группу пакетов не удалось поставить в очередь"""
+        apply_async = group.apply_async
+        failed = []
+
+        def flaky_apply_async(batches, *args, **kwargs):
+            if not failed:
+                failed.append(batches)
+                raise OperationalError('Broker unavailable')
+            return apply_async(batches, *args, **kwargs)
+
+        with mock.patch.object(group, 'apply_async', flaky_apply_async):
+            result = send_course_update_notification.delay(self.course.id)
+        self.assertTrue(result.successful())
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(len(mail.outbox), 5)
+
+
+@override_settings(COURSE_NOTIFICATION_WINDOW=900, OUTBOX_RELAY_IN_THREAD=False)
+class CourseNotificationOutboxTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+        self.url = reverse('materials:course-detail', kwargs={'pk': self.course.id})
+        self.client.force_authenticate(user=self.user)
+
+    @mock.patch('materials.tasks.send_course_update_notification.apply_async')
+    def test_updates_coalesced(self, apply_async):
+        """Тест одного отложенного уведомления на несколько изменений в окне"""
+        for i in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(self.url, {'title': f'Title {i}'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        message = OutboxMessage.objects.get()
+        self.assertIsNotNone(message.published_at)
+        apply_async.assert_called_once_with(
+            (self.course.id,), {}, eta=message.eta, task_id=f'outbox-{message.pk}'
+        )
+
+        # После окна следующее изменение планирует новое уведомление
+        OutboxMessage.objects.update(eta=timezone.now() - timedelta(seconds=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'title': 'Next window'})
+        self.assertEqual(apply_async.call_count, 2)
+
+    @mock.patch('materials.tasks.send_course_update_notification.apply_async')
+    def test_check_serialized_on_course(self, apply_async):
+        """Тест блокировки строки курса до проверки запланированного уведомления"""
+        with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+            notify_course_updated(self.course.id)
+        sql = [query['sql'] for query in queries.captured_queries]
+        course_table = Course._meta.db_table
+        self.assertIn('FOR UPDATE', sql[0])
+        self.assertIn(f'"{course_table}"', sql[0])
+        self.assertIn(f'"{OutboxMessage._meta.db_table}"', sql[1])
+
+    def test_invisible_change_skipped(self):
+        """Тест отсутствия уведомления, если видимые поля не изменились"""
+        self.client.patch(self.url, {'title': 'Test Course'})
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    @mock.patch('materials.tasks.send_course_update_notification.apply_async')
+    def test_rollback_discards_message(self, apply_async):
+        """Тест отсутствия публикации при откате транзакции"""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    notify_course_updated(self.course.id)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertFalse(OutboxMessage.objects.exists())
+        apply_async.assert_not_called()
+
+    @mock.patch('materials.tasks.send_course_update_notification.apply_async')
+    def test_sweeper_publishes_pending(self, apply_async):
+        """Тест публикации пропущенных сообщений и удаления старых периодической задачей"""
+        for _ in range(3):
+            OutboxMessage.objects.create(task_name=send_course_update_notification.name, args=[self.course.id])
+        OutboxMessage.objects.create(
+            task_name=send_course_update_notification.name,
+            published_at=timezone.now() - timedelta(days=30),
+        )
+
+        relay_outbox()
+        self.assertEqual(apply_async.call_count, 3)
+        self.assertEqual(OutboxMessage.objects.count(), 3)
+        self.assertFalse(OutboxMessage.objects.filter(published_at__isnull=True).exists())
+
+    @mock.patch('materials.tasks.send_course_update_notification.apply_async')
+    def test_broker_failure_keeps_sent_messages(self, apply_async):
+        """Тест остановки на ошибке брокера: принятые сообщения отмечены и не публикуются повторно"""
+        messages = [
+            OutboxMessage.objects.create(task_name=send_course_update_notification.name, args=[self.course.id])
+            for _ in range(3)
+        ]
+        apply_async.side_effect = [None, OperationalError('Broker unavailable')]
+        with self.assertRaises(OperationalError):
+            relay_outbox()
+        self.assertEqual(
+            list(OutboxMessage.objects.filter(published_at__isnull=False).values_list('pk', flat=True)),
+            [messages[0].pk]
+        )
+
+        apply_async.side_effect = None
+        relay_outbox()
+        # Первое сообщение не отправлено повторно, второе повторено после ошибки
+        task_ids = [call.kwargs['task_id'] for call in apply_async.call_args_list]
+        self.assertEqual(task_ids, [f'outbox-{messages[index].pk}' for index in (0, 1, 1, 2)])
+        self.assertFalse(OutboxMessage.objects.filter(published_at__isnull=True).exists())
+
+    def test_republished_message_skipped(self):
+        """Тест пропуска задачей повторно опубликованного сообщения outbox"""
+        message = OutboxMessage.objects.create(task_name=send_course_update_notification.name, args=[self.course.id])
+        Subscription.objects.create(user=self.user, course=self.course)
+        task_id = f'outbox-{message.pk}'
+
+        with mock.patch('materials.tasks.group') as batches:
+            send_course_update_notification.apply(args=(self.course.id,), task_id=task_id)
+            result = send_course_update_notification.apply(args=(self.course.id,), task_id=task_id)
+        self.assertEqual(batches.return_value.apply_async.call_count, 1)
+        self.assertIn('уже обработано', result.get())
+        message.refresh_from_db()
+        self.assertIsNotNone(message.processed_at)
+
+
+class AsyncViewsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='user@test.com')
+        self.other = User.objects.create(email='other@test.com')
+        for owner in (self.user, self.user, self.other):
+            course = Course.objects.create(title='Курс', owner=owner)
+            for i in range(3):
+                Lesson.objects.create(title=f'Урок {i}', course=course, owner=owner)
+        self.course = Course.objects.filter(owner=self.user).first()
+        self.factory = APIRequestFactory()
+
+    def call(self, view, path, params=None, headers=None, user=None, **kwargs):
+        """Ответ представления на GET без кэша ответов; асинхронное выполняется в цикле событий"""
+        cache.clear()
+        request = self.factory.get(path, params or {}, **(headers or {}))
+        force_authenticate(request, user=user or self.user)
+        if asyncio.iscoroutinefunction(view):
+            response = async_to_sync(view)(request, **kwargs)
+        else:
+            response = view(request, **kwargs)
+        # 304 - обычный HttpResponse без отложенного рендеринга
+        return response.render() if hasattr(response, 'render') else response
+
+    def assertSameResponses(self, sync_view, async_view, path, params=None, headers=None, user=None, **kwargs):
+        expected = self.call(sync_view, path, params, headers, user, **kwargs)
+        response = self.call(async_view, path, params, headers, user, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.headers.get('ETag'), expected.headers.get('ETag'))
+        return response
+
+    def test_course_views_match_sync(self):
+        """Тест одинаковых ответов синхронного и асинхронного CourseViewSet"""
+        actions = {'get': 'list'}
+        list_views = (CourseViewSet.as_view(actions), AsyncCourseViewSet.as_view(actions))
+        self.assertTrue(asyncio.iscoroutinefunction(list_views[1]))
+        for params in ({}, {'page_size': 1, 'page': 2}, {'pagination': 'cursor', 'page_size': 1},
+                       {'fields': 'id,title,lessons.title'}, {'page': 5}):
+            with self.subTest(params=params):
+                self.assertSameResponses(*list_views, '/courses/', params)
+
+        etag = self.assertSameResponses(*list_views, '/courses/').headers['ETag']
+        response = self.assertSameResponses(*list_views, '/courses/', headers={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        actions = {'get': 'retrieve'}
+        detail_views = (CourseViewSet.as_view(actions), AsyncCourseViewSet.as_view(actions))
+        response = self.assertSameResponses(*detail_views, f'/courses/{self.course.pk}/', pk=self.course.pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        other_course = Course.objects.get(owner=self.other)
+        response = self.assertSameResponses(*detail_views, f'/courses/{other_course.pk}/', pk=other_course.pk)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_lesson_list_matches_sync(self):
+        """Тест одинаковых ответов синхронного и асинхронного списка уроков"""
+        views = (LessonListAPIView.as_view(), AsyncLessonListAPIView.as_view())
+        for params in ({}, {'page': 2}, {'fields': 'id,title'}, {'pagination': 'cursor'}):
+            with self.subTest(params=params):
+                self.assertSameResponses(*views, '/lessons/', params)
+        admin = User.objects.create(email='admin@test.com', is_staff=True)
+        response = self.assertSameResponses(*views, '/lessons/', {'page_size': 50}, user=admin)
+        self.assertEqual(response.data['count'], 9)
+
+    def test_async_write_and_auth(self):
+        """Тест записи через асинхронный ViewSet и отказа без аутентификации"""
+        view = AsyncCourseViewSet.as_view({'get': 'list', 'post': 'create'})
+        request = self.factory.post('/courses/', {'title': 'Новый курс'}, format='json')
+        force_authenticate(request, user=self.user)
+        response = async_to_sync(view)(request)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Course.objects.filter(title='Новый курс', owner=self.user).exists())
+
+        response = async_to_sync(view)(self.factory.get('/courses/'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """Поддельный API Stripe: отвечает по очереди из server.responses и запоминает запросы"""
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.server.requests.append({
+            'path': self.path,
+            'port': self.client_address[1],
+            'idempotency_key': self.headers.get('Idempotency-Key'),
+        })
+        status_code, body, delay = self.server.responses.pop(0)
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент закрыл соединение по таймауту
+            pass
+
+    do_GET = do_POST = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+SESSION = {'id': 'cs_1', 'object': 'checkout.session', 'status': 'open', 'payment_status': 'unpaid'}
+API_ERROR = {'error': {'type': 'api_error', 'message': 'Stripe is down'}}
+INVALID_REQUEST = {'error': {'type': 'invalid_request_error', 'message': 'No such session'}}
+
+
+class StripeServiceTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStripeHandler)
+        self.server.requests, self.server.responses = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings_override = override_settings(
+            STRIPE_SECRET_KEY='sk_test_fake',
+            STRIPE_API_BASE=f'http://127.0.0.1:{self.server.server_port}',
+            STRIPE_MAX_RETRIES=2,
+            STRIPE_RETRY_BASE_DELAY=0,
+            STRIPE_READ_TIMEOUT=0.5,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        services.reset_client()
+        self.addCleanup(services.reset_client)
+
+    def call_outcomes(self, logs):
+        """(операция, исход, попытки) из итоговых строк лога вызовов Stripe"""
+        return [
+            (record.stripe_operation, record.stripe_outcome, record.stripe_attempts)
+            for record in logs.records if hasattr(record, 'stripe_outcome')
+        ]
+
+    def respond(self, *responses):
+        self.server.responses.extend(
+            response if len(response) == 3 else (*response, 0) for response in responses
+        )
+
+    def test_retries_over_keep_alive_connection(self):
+        """Тест повторов при 5xx через одно keep-alive соединение"""
+        self.respond((500, API_ERROR), (503, API_ERROR), (200, SESSION))
+        with self.assertLogs('materials.services') as logs:
+            session = services.get_stripe_session_status('cs_1')
+        self.assertEqual(session['payment_status'], 'unpaid')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len({request['port'] for request in self.server.requests}), 1)
+        self.assertEqual(self.call_outcomes(logs), [('checkout_session.retrieve', 'ok', 3)])
+
+    def test_create_retry_reuses_idempotency_key(self):
+        """Тест повтора создания с тем же Idempotency-Key"""
+        self.respond((500, API_ERROR), (200, SESSION))
+        session = services.create_stripe_checkout_session('price_1', 'http://t/ok', 'http://t/cancel')
+        self.assertEqual(session.id, 'cs_1')
+        keys = [request['idempotency_key'] for request in self.server.requests]
+        self.assertEqual(len(keys), 2)
+        self.assertIsNotNone(keys[0])
+        self.assertEqual(keys[0], keys[1])
+
+    def test_client_error_not_retried(self):
+        """Тест отсутствия повторов при ошибке запроса (4xx)"""
+        self.respond((404, INVALID_REQUEST))
+        self.assertIsNone(services.get_stripe_session_status('cs_missing'))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(services.breaker.state, services.CircuitBreaker.CLOSED)
+
+    @override_settings(STRIPE_MAX_RETRIES=0)
+    def test_read_timeout(self):
+        """Тест таймаута чтения зависшего ответа"""
+        self.respond((200, SESSION, 1))
+        started = time.monotonic()
+        self.assertIsNone(services.get_stripe_session_status('cs_1'))
+        self.assertLess(time.monotonic() - started, 1)
+
+    @override_settings(STRIPE_MAX_RETRIES=0)
+    def test_circuit_breaker(self):
+        """Тест размыкания предохранителя, быстрых отказов и пробного вызова"""
+        with mock.patch.multiple(services.breaker, failure_threshold=2, reset_timeout=0.2):
+            self.respond((500, API_ERROR), (500, API_ERROR))
+            self.assertIsNone(services.get_stripe_session_status('cs_1'))
+            self.assertIsNone(services.get_stripe_session_status('cs_1'))
+            self.assertEqual(services.breaker.state, services.CircuitBreaker.OPEN)
+
+            # Разомкнутый предохранитель не обращается к Stripe
+            with self.assertLogs('materials.services') as logs:
+                self.assertIsNone(services.get_stripe_session_status('cs_1'))
+            self.assertEqual(len(self.server.requests), 2)
+            self.assertEqual(self.call_outcomes(logs), [('checkout_session.retrieve', 'rejected', 0)])
+
+            time.sleep(0.25)
+            self.respond((200, SESSION))
+            self.assertIsNotNone(services.get_stripe_session_status('cs_1'))
+            self.assertEqual(services.breaker.state, services.CircuitBreaker.CLOSED)
+
+    def test_reset_client_rereads_breaker_settings(self):
+        """Тест перечитывания порогов предохранителя при reset_client"""
+        with override_settings(STRIPE_BREAKER_THRESHOLD=1, STRIPE_BREAKER_RESET_TIMEOUT=0.2):
+            services.reset_client()
+            self.assertEqual(services.breaker.failure_threshold, 1)
+            self.assertEqual(services.breaker.reset_timeout, 0.2)
+
+            self.respond((500, API_ERROR))
+            with self.settings(STRIPE_MAX_RETRIES=0):
+                self.assertIsNone(services.get_stripe_session_status('cs_1'))
+            self.assertEqual(services.breaker.state, services.CircuitBreaker.OPEN)
+
+        services.reset_client()
+        self.assertEqual(services.breaker.failure_threshold, settings.STRIPE_BREAKER_THRESHOLD)
+        self.assertEqual(services.breaker.state, services.CircuitBreaker.CLOSED)
+
+    def test_unexpected_error_in_probe_reopens_breaker(self):
+        """Тест пробного вызова с ошибкой не Stripe: предохранитель снова разомкнут, а не полуоткрыт"""
+        def broken(params):
+            raise KeyError('id')
+
+        with mock.patch.multiple(services.breaker, failure_threshold=1, reset_timeout=0.2):
+            services.breaker.record_failure()
+            time.sleep(0.25)
+            with self.assertRaises(KeyError):
+                services.call_stripe('checkout_session.retrieve', broken)
+            self.assertEqual(services.breaker.state, services.CircuitBreaker.OPEN)
+
+            time.sleep(0.25)
+            self.respond((200, SESSION))
+            self.assertIsNotNone(services.get_stripe_session_status('cs_1'))
+            self.assertEqual(services.breaker.state, services.CircuitBreaker.CLOSED)
@@ -1,20 +1,26 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from materials.views import (CourseViewSet, LessonCreateAPIView,
-                             LessonDestroyAPIView, LessonListAPIView,
-                             LessonRetrieveAPIView, LessonUpdateAPIView, SubscriptionAPIView)
+from materials.views import (AsyncCourseViewSet, AsyncLessonListAPIView, CourseViewSet, LessonBulkAPIView,
+                             LessonCreateAPIView, LessonDestroyAPIView, LessonListAPIView,
+                             LessonRetrieveAPIView, LessonUpdateAPIView, SubscriptionAPIView,
+                             SubscriptionBulkAPIView)
 
 router = DefaultRouter()
-router.register(r"courses", CourseViewSet)
+# Асинхронные представления чтения - при запуске под ASGI
+router.register(r"courses", AsyncCourseViewSet if settings.ASYNC_VIEWS else CourseViewSet)
 
 app_name = "materials"
 
 urlpatterns = [
     path("lessons/create/", LessonCreateAPIView.as_view(), name="lesson-create"),
-    path("lessons/", LessonListAPIView.as_view(), name="lesson-list"),
+    path("lessons/bulk/", LessonBulkAPIView.as_view(), name="lesson-bulk"),
+    path("lessons/", (AsyncLessonListAPIView if settings.ASYNC_VIEWS else LessonListAPIView).as_view(),
+         name="lesson-list"),
     path("lessons/<int:pk>/", LessonRetrieveAPIView.as_view(), name="lesson-get"),
     path("lessons/update/<int:pk>/", LessonUpdateAPIView.as_view(), name="lesson-update"),
     path("lessons/delete/<int:pk>/", LessonDestroyAPIView.as_view(), name="lesson-delete"),
     path("subscription/", SubscriptionAPIView.as_view(), name="subscription"),
+    path("subscription/bulk/", SubscriptionBulkAPIView.as_view(), name="subscription-bulk"),
 ] + router.urls
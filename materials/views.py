@@ -1,18 +1,29 @@
-from django.shortcuts import get_object_or_404
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, FilteredRelation, Max, OuterRef, Prefetch, Q
+from django.http import Http404
+from django.utils import timezone
 from rest_framework import generics, status, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from config.async_views import AsyncAPIViewMixin
+from materials.caching import GLOBAL_GENERATION, bump_generation, course_response_cache_key
+from materials.mixins import ConditionalGetMixin, SparseFieldsViewMixin, sparse_columns
 from materials.models import Course, Lesson, Subscription
-from materials.serializers import CourseSerializer, LessonSerializer
-from users.permissions import IsModerator, IsOwner
-from materials.tasks import send_course_update_notification
+from materials.serializers import (CourseSerializer, LessonBulkItemSerializer, LessonSerializer,
+                                   SubscriptionBulkSerializer)
+from users.permissions import IsModerator, IsOwner, is_moderator
+from materials.notifications import notify_course_updated, visible_state
 
 from .paginators import (CoursePagination, LessonPagination)
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ConditionalGetMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet для работы с курсами.
 
@@ -33,10 +44,15 @@ class CourseViewSet(viewsets.ModelViewSet):
 
     destroy:
     Удалить курс. Требуется аутентификация и права модератора/владельца/администратора.
+
+    Для list и retrieve можно ограничить поля ответа:
+    - fields: Поля через запятую, для уроков - lessons.<поле> (например, id,title,lessons.title)
+    - expand=lessons: Добавить уроки при указанном fields
     """
     serializer_class = CourseSerializer
     queryset = Course.objects.all()
     pagination_class = CoursePagination
+    expandable_fields = ('lessons',)
 
     def get_permissions(self):
         # Для генерации схемы пропускаем проверку прав
@@ -54,22 +70,136 @@ class CourseViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def has_full_access(self):
+        """Администраторы и модераторы видят все курсы, остальные - только свои"""
+        return self.request.user.is_staff or is_moderator(self.request)
+
+    def get_visible_queryset(self):
+        queryset = self.queryset
+        if not self.has_full_access():
+            queryset = queryset.filter(owner=self.request.user)
+        return queryset
+
     def get_queryset(self):
         # Для генерации схемы возвращаем пустой queryset
         if getattr(self, 'swagger_fake_view', False):
             return Course.objects.none()
 
-        if not self.request.user.is_staff and not IsModerator().has_permission(self.request, self):
-            return self.queryset.filter(owner=self.request.user)
-        return self.queryset
+        queryset = self.get_visible_queryset()
+        fields, nested = self.get_sparse_fields()
+        if fields is not None:
+            queryset = queryset.only(*sparse_columns(Course, fields, required=('id', 'owner')))
+
+        # Количество уроков, подписка и сами уроки считаются одним набором запросов на всю страницу
+        if fields is None or 'lessons_count' in fields:
+            queryset = queryset.annotate(lessons_count=Count('lessons', distinct=True))
+        if fields is None or 'is_subscribed' in fields:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(user=self.request.user, course=OuterRef('pk'))
+            ))
+        if fields is None or 'lessons' in fields:
+            lessons = Lesson.objects.all()
+            if 'lessons' in nested:
+                lessons = lessons.only(*sparse_columns(Lesson, nested['lessons'], required=('id', 'course')))
+            queryset = queryset.prefetch_related(Prefetch('lessons', queryset=lessons))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        return (self.not_modified(request, *args, **kwargs)
+                or self.cached_response(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return (self.not_modified(request, *args, **kwargs)
+                or self.cached_response(super().retrieve, request, *args, **kwargs))
+
+    def get_validator_queryset(self, request, *args, **kwargs):
+        """
+        Один агрегатный запрос по видимым курсам, их урокам и подпискам пользователя.
+
+        Количество строк учитывается, чтобы удаление тоже меняло ETag.
+        """
+        queryset = self.get_visible_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.filter(pk=kwargs[self.lookup_url_kwarg or self.lookup_field])
+
+        return queryset.annotate(
+            user_subscription=FilteredRelation(
+                'subscriptions', condition=Q(subscriptions__user=request.user)
+            ),
+        )
+
+    def get_validator_aggregates(self):
+        return {
+            'course_count': Count('id', distinct=True),
+            'course_updated': Max('updated_at'),
+            'lesson_count': Count('lessons', distinct=True),
+            'lesson_updated': Max('lessons__updated_at'),
+            'subscription_count': Count('user_subscription', distinct=True),
+            'subscription_updated': Max('user_subscription__subscribed_at'),
+        }
+
+    def build_validator_state(self, state):
+        if not state['course_count']:
+            return None
+        # Только ETag: удаление урока или подписки не двигает максимум дат вперёд
+        return None, sorted(state.items())
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        """
+        Отдаёт данные ответа из кэша, минуя queryset и сериализатор.
+
+        Права проверяются до вызова, инвалидация - через поколения (materials.signals).
+        """
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.COURSE_CACHE_TIMEOUT)
+        return response
+
+    def get_response_cache_key(self, request):
+        scope = 'all' if self.has_full_access() else 'own'
+        return course_response_cache_key(request, scope)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        """Уведомляем подписчиков, только если изменились видимые им поля"""
+        previous = visible_state(serializer.instance)
+        course = serializer.save()
+        if visible_state(course) != previous:
+            # Уведомление пишется в outbox той же транзакцией, что и курс
+            notify_course_updated(course.id)
+
+
+class AsyncCourseViewSet(AsyncAPIViewMixin, CourseViewSet):
+    """
+    CourseViewSet с асинхронными list и retrieve для ASGI (settings.ASYNC_VIEWS).
+
+    Ответы, кэш, ETag и права те же; запись выполняется синхронными
+    обработчиками CourseViewSet в потоке.
+    """
+
+    async def list(self, request, *args, **kwargs):
+        return (await self.anot_modified(request, *args, **kwargs)
+                or await self.acached_response(self.alist, request, *args, **kwargs))
+
+    async def retrieve(self, request, *args, **kwargs):
+        return (await self.anot_modified(request, *args, **kwargs)
+                or await self.acached_response(self.aretrieve, request, *args, **kwargs))
 
-    def update(self, request, *args, **kwargs):
-        """Переопределяем update для отправки уведомлений"""
-        response = super().update(request, *args, **kwargs)
+    async def acached_response(self, handler, request, *args, **kwargs):
+        """cached_response для асинхронного обработчика"""
+        key = await sync_to_async(self.get_response_cache_key)(request)
+        data = await cache.aget(key)
+        if data is not None:
+            return Response(data)
 
-        # Отправляем асинхронное уведомление об обновлении курса
-        course_id = self.get_object().id
-        send_course_update_notification.delay(course_id)
+        response = await handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            await cache.aset(key, response.data, settings.COURSE_CACHE_TIMEOUT)
         return response
 
 
@@ -87,12 +217,108 @@ class LessonCreateAPIView(generics.CreateAPIView):
         serializer.save(owner=self.request.user)
 
 
-class LessonListAPIView(generics.ListAPIView):
+class LessonBulkAPIView(APIView):
+    """
+    Создать и обновить несколько уроков одним запросом.
+
+    Требуется аутентификация. Принимает список уроков (до 1000): элементы с id
+    обновляются (частично, нужны права модератора/владельца/администратора),
+    элементы без id создаются (модераторы не могут создавать уроки).
+
+    Все элементы проверяются до записи; при ошибках ничего не сохраняется, а в
+    ответе 400 возвращается список ошибок по позициям ({} для корректных
+    элементов). При успехе возвращаются уроки в порядке запроса.
+    """
+    permission_classes = [IsAuthenticated]
+    max_items = 1000
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'non_field_errors': ['Ожидается непустой список уроков']})
+        if len(items) > self.max_items:
+            raise ValidationError({'non_field_errors': [f'Не больше {self.max_items} уроков за запрос']})
+
+        # Курсы и обновляемые уроки загружаются одним запросом каждые
+        course_ids = {self._int_or_none(item.get('course')) for item in items if isinstance(item, dict)}
+        lesson_ids = {self._int_or_none(item.get('id')) for item in items if isinstance(item, dict)}
+        courses = Course.objects.only('id').in_bulk(course_ids - {None})
+        lessons = Lesson.objects.in_bulk(lesson_ids - {None})
+        context = {'request': request, 'view': self, 'preloaded': {Course: courses}}
+        full_access = request.user.is_staff or is_moderator(request)
+
+        validated, errors = [], []
+        for item in items:
+            serializer, item_errors = self._validate_item(item, lessons, context, full_access)
+            validated.append(serializer)
+            errors.append(item_errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        result, created, updated, update_fields = [], [], [], {'updated_at'}
+        now = timezone.now()
+        for serializer in validated:
+            data = dict(serializer.validated_data)
+            data.pop('id', None)
+            if serializer.instance is None:
+                lesson = Lesson(owner=request.user, **data)
+                created.append(lesson)
+            else:
+                lesson = serializer.instance
+                for field, value in data.items():
+                    setattr(lesson, field, value)
+                # bulk_update не вызывает auto_now
+                lesson.updated_at = now
+                update_fields.update(data)
+                updated.append(lesson)
+            result.append(lesson)
+
+        with transaction.atomic():
+            Lesson.objects.bulk_create(created)
+            if updated:
+                Lesson.objects.bulk_update(updated, sorted(update_fields))
+        # Массовые операции не отправляют post_save
+        bump_generation(GLOBAL_GENERATION)
+
+        return Response(LessonSerializer(result, many=True, context=context).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @staticmethod
+    def _int_or_none(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _validate_item(self, item, lessons, context, full_access):
+        """Возвращает (сериализатор, ошибки элемента)"""
+        if not isinstance(item, dict):
+            return None, {'non_field_errors': ['Ожидается объект урока']}
+
+        instance = None
+        if item.get('id') is not None:
+            instance = lessons.get(self._int_or_none(item['id']))
+            if instance is None:
+                return None, {'id': ['Урок не найден']}
+            if not full_access and instance.owner_id != self.request.user.pk:
+                return None, {'id': ['Недостаточно прав для изменения урока']}
+        elif is_moderator(self.request):
+            return None, {'non_field_errors': ['Модераторы не могут создавать уроки']}
+
+        serializer = LessonBulkItemSerializer(instance, data=item, partial=instance is not None, context=context)
+        serializer.is_valid()
+        return serializer, serializer.errors
+
+
+class LessonListAPIView(ConditionalGetMixin, SparseFieldsViewMixin, generics.ListAPIView):
     """
     Получить список всех уроков.
 
     Требуется аутентификация. Обычные пользователи видят только свои уроки,
     модераторы и администраторы видят все уроки.
+
+    Параметры запроса:
+    - fields: Поля ответа через запятую (например, id,title)
     """
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated]
@@ -103,21 +329,67 @@ class LessonListAPIView(generics.ListAPIView):
         if getattr(self, 'swagger_fake_view', False):
             return Lesson.objects.none()
 
-        if not self.request.user.is_staff and not IsModerator().has_permission(self.request, self):
-            return Lesson.objects.filter(owner=self.request.user)
-        return Lesson.objects.all()
+        queryset = Lesson.objects.all()
+        if not self.request.user.is_staff and not is_moderator(self.request):
+            queryset = queryset.filter(owner=self.request.user)
+
+        fields, _ = self.get_sparse_fields()
+        if fields is not None:
+            queryset = queryset.only(*sparse_columns(Lesson, fields))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        return self.not_modified(request) or super().list(request, *args, **kwargs)
+
+    def get_validator_queryset(self, request, *args, **kwargs):
+        return self.filter_queryset(self.get_queryset())
+
+    def get_validator_aggregates(self):
+        return {'lesson_count': Count('id'), 'lesson_updated': Max('updated_at')}
 
+    def build_validator_state(self, state):
+        if not state['lesson_count']:
+            return None
+        # Только ETag: удаление урока не двигает максимум дат вперёд
+        return None, sorted(state.items())
 
-class LessonRetrieveAPIView(generics.RetrieveAPIView):
+
+class AsyncLessonListAPIView(AsyncAPIViewMixin, LessonListAPIView):
+    """LessonListAPIView на асинхронном ORM для ASGI (settings.ASYNC_VIEWS)"""
+
+    async def get(self, request, *args, **kwargs):
+        return await self.anot_modified(request) or await self.alist(request, *args, **kwargs)
+
+
+class LessonRetrieveAPIView(ConditionalGetMixin, SparseFieldsViewMixin, generics.RetrieveAPIView):
     """
     Получить детальную информацию об уроке по ID.
 
     Требуется аутентификация и права модератора/владельца/администратора.
+
+    Параметры запроса:
+    - fields: Поля ответа через запятую (например, id,title)
     """
     serializer_class = LessonSerializer
     queryset = Lesson.objects.all()
     permission_classes = [IsAuthenticated, IsModerator | IsOwner | IsAdminUser]
 
+    def get_queryset(self):
+        fields, _ = self.get_sparse_fields()
+        if fields is not None:
+            # Владелец нужен для проверки прав на объект, updated_at - для ETag
+            return self.queryset.only(*sparse_columns(Lesson, fields, required=('id', 'owner', 'updated_at')))
+        return self.queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        # Объект загружается до проверки ETag, чтобы сначала проверить права на него
+        instance = self.get_object()
+        return (self.not_modified(request, instance)
+                or Response(self.get_serializer(instance).data))
+
+    def get_validator_state(self, request, instance):
+        return instance.updated_at, (instance.pk, instance.updated_at)
+
 
 class LessonUpdateAPIView(generics.UpdateAPIView):
     """
@@ -155,17 +427,45 @@ class SubscriptionAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        user = request.user
         course_id = request.data.get('course_id')
-        course = get_object_or_404(Course, id=course_id)
+        try:
+            course_id = int(course_id)
+        except (TypeError, ValueError):
+            raise Http404
 
-        subscription = Subscription.objects.filter(user=user, course=course)
+        subscribed = Subscription.objects.toggle(request.user.pk, course_id)
+        if subscribed is None:
+            raise Http404
+        message = 'Подписка добавлена' if subscribed else 'Подписка удалена'
+
+        return Response({"message": message}, status=status.HTTP_200_OK)
 
-        if subscription.exists():
-            subscription.delete()
-            message = 'Подписка удалена'
-        else:
-            Subscription.objects.create(user=user, course=course)
-            message = 'Подписка добавлена'
 
-        return Response({"message": message}, status=status.HTTP_200_OK)
\ No newline at end of file
+class SubscriptionBulkAPIView(APIView):
+    """
+    Подписать или отписать пользователя от нескольких курсов.
+
+    Требуется аутентификация.
+
+    Параметры запроса:
+    - action: subscribe или unsubscribe
+    - course_ids: Список ID курсов (до 1000)
+
+    Возвращает:
+    - course_ids: ID курсов, на которые пользователь подписан (subscribe) или от которых отписан (unsubscribe)
+    - not_found: ID несуществующих курсов (subscribe)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = SubscriptionBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course_ids = set(serializer.validated_data['course_ids'])
+
+        if serializer.validated_data['action'] == 'subscribe':
+            changed = Subscription.objects.subscribe_many(request.user.pk, course_ids)
+            data = {'course_ids': sorted(changed), 'not_found': sorted(course_ids - changed)}
+        else:
+            changed = Subscription.objects.unsubscribe_many(request.user.pk, course_ids)
+            data = {'course_ids': sorted(changed)}
+        return Response(data, status=status.HTTP_200_OK)
\ No newline at end of file
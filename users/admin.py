@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from users.models import StripePrice
+
+
+@admin.register(StripePrice)
+class StripePriceAdmin(admin.ModelAdmin):
+    list_display = ('id', 'course', 'lesson', 'amount', 'currency', 'stripe_price_id', 'is_active')
+    list_filter = ('is_active', 'currency')
+    raw_id_fields = ('course', 'lesson')
+    readonly_fields = ('stripe_product_id', 'stripe_price_id')
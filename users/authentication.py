@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import ClaimsUser
+
+
+def revocation_cache_key(user_id):
+    return f'users:revoked:{user_id}'
+
+
+def revoke_tokens(user_ids):
+    """
+    Отзывает все выданные до этого момента токены пользователей.
+
+    Отметка хранится в кэше (в продакшене Redis, общий для всех процессов)
+    на время жизни refresh-токена - дольше старые токены не живут.
+    """
+    revoked_at = int(time.time())
+    cache.set_many(
+        {revocation_cache_key(user_id): revoked_at for user_id in user_ids},
+        settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds(),
+    )
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация без загрузки пользователя из БД.
+
+    Пользователь восстанавливается из claims токена (id, is_staff, роль
+    модератора) как ClaimsUser; остальные поля загружаются лениво. Вместо
+    проверки is_active в БД проверяется отметка отзыва в кэше. Токены без
+    claims (выданные раньше) проверяются обычным способом.
+    """
+
+    def get_user(self, validated_token):
+        if 'is_staff' not in validated_token:
+            return super().get_user(validated_token)
+
+        # simplejwt хранит id строкой
+        user_id = ClaimsUser._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        revoked_at = cache.get(revocation_cache_key(user_id))
+        if revoked_at is not None and validated_token['iat'] <= revoked_at:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        loaded = {'id': user_id, 'is_staff': validated_token['is_staff'], 'is_active': True}
+        user = ClaimsUser.from_db(
+            router.db_for_read(ClaimsUser),
+            list(loaded),
+            [loaded[field.attname] for field in ClaimsUser._meta.concrete_fields if field.attname in loaded],
+        )
+        user.moderator_claim = validated_token.get('is_moderator')
+        return user
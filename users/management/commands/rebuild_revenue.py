@@ -0,0 +1,60 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+from users.models import DailyRevenue, Payment
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает выручку по дням (DailyRevenue) из оплаченных платежей"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Пересчитать начиная с дня YYYY-MM-DD (по умолчанию - всё)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since: ожидается дата в формате YYYY-MM-DD')
+
+        payments = (
+            Payment.objects.filter(stripe_payment_status='paid')
+            .annotate(day=TruncDate('payment_date'))
+            .values('day', 'paid_course', 'paid_lesson', 'payment_method')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by()
+        )
+        rollups = DailyRevenue.objects.all()
+        if since:
+            payments = payments.filter(day__gte=since)
+            rollups = rollups.filter(day__gte=since)
+
+        with transaction.atomic():
+            # Оплаты, пришедшие во время пересчёта, ждут его окончания и добавляются
+            # уже к новым строкам; зафиксированные раньше попадают в агрегат
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'LOCK TABLE {connection.ops.quote_name(DailyRevenue._meta.db_table)} IN EXCLUSIVE MODE'
+                )
+            deleted, _ = rollups.delete()
+            created = DailyRevenue.objects.bulk_create(
+                [
+                    DailyRevenue(
+                        day=row['day'],
+                        course_id=row['paid_course'],
+                        lesson_id=row['paid_lesson'],
+                        payment_method=row['payment_method'],
+                        total=row['total'],
+                        count=row['count'],
+                    )
+                    for row in payments.iterator(chunk_size=2000)
+                ],
+                batch_size=1000,
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Удалено строк: {deleted}, создано: {len(created)}'))
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0005_course_created_at_id_idx"),
+        ("users", "0004_payment_stripe_payment_status_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["payment_date", "id"], name="payment_date_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import migrations, transaction
+from django.utils import timezone
+
+
+def backfill_last_login(apps, schema_editor):
+    """
+    Проставляет время миграции активным пользователям без last_login.
+
+    До включения SIMPLE_JWT['UPDATE_LAST_LOGIN'] вход по JWT не записывал
+    last_login, и deactivate_inactive_users судил бы таких пользователей по
+    дате регистрации. Теперь срок неактивности отсчитывается от миграции,
+    в том числе для действительно давно не заходивших: их деактивация
+    откладывается на INACTIVE_USER_DAYS.
+
+    Как и задача деактивации, обновляет пакетами по DEACTIVATION_CHUNK_SIZE
+    по первичному ключу, каждый пакет - отдельная транзакция (миграция не
+    атомарная), поэтому таблица не блокируется надолго.
+    """
+    User = apps.get_model('users', 'User')
+    chunk_size = settings.DEACTIVATION_CHUNK_SIZE
+    now = timezone.now()
+    pending = User.objects.filter(is_active=True, last_login__isnull=True).order_by('pk')
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            user_ids = list(pending.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+            if not user_ids:
+                break
+            User.objects.filter(pk__in=user_ids, last_login__isnull=True).update(last_login=now)
+        last_pk = user_ids[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("users", "0010_dailyrevenue"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_login, migrations.RunPython.noop),
+    ]
@@ -55,6 +55,32 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [
+            # Поиск неактивных пользователей (users.tasks.deactivate_inactive_users)
+            models.Index(fields=['last_login'], condition=models.Q(is_active=True),
+                         name='user_active_last_login_idx'),
+            models.Index(fields=['date_joined'], condition=models.Q(is_active=True, last_login__isnull=True),
+                         name='user_active_never_logged_idx'),
+        ]
+
+
+class ClaimsUser(User):
+    """
+    Пользователь, восстановленный из claims JWT без запроса к БД.
+
+    Загружены только id, is_staff и is_active; при обращении к любому другому
+    полю все остальные поля загружаются одним запросом.
+    """
+    moderator_claim = None
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred_fields = self.get_deferred_fields()
+        if fields is not None and set(fields) <= deferred_fields:
+            fields = deferred_fields
+        super().refresh_from_db(using, fields, from_queryset)
 
 
 class Payment(models.Model):
@@ -66,7 +92,8 @@ class Payment(models.Model):
     # Новые поля для Stripe
     stripe_product_id = models.CharField(max_length=100, blank=True, null=True, verbose_name="ID продукта в Stripe")
     stripe_price_id = models.CharField(max_length=100, blank=True, null=True, verbose_name="ID цены в Stripe")
-    stripe_session_id = models.CharField(max_length=100, blank=True, null=True, verbose_name="ID сессии в Stripe")
+    stripe_session_id = models.CharField(max_length=100, blank=True, null=True, db_index=True,
+                                         verbose_name="ID сессии в Stripe")
     stripe_payment_url = models.URLField(max_length=500, blank=True, null=True, verbose_name="Ссылка для оплаты")
     stripe_payment_status = models.CharField(max_length=20, default='pending', verbose_name="Статус оплаты в Stripe")
 
@@ -115,3 +142,112 @@ class Payment(models.Model):
         verbose_name = 'Платеж'
         verbose_name_plural = 'Платежи'
         ordering = ['-payment_date']
+        indexes = [
+            models.Index(fields=['payment_date', 'id'], name='payment_date_id_idx'),
+        ]
+
+
+class StripePrice(models.Model):
+    """
+    Каталог цен: курс или урок, сумма и валюта с продуктом и ценой в Stripe.
+
+    Продукт и цена создаются в Stripe один раз и переиспользуются всеми
+    платежами (users.services.get_catalog_price). Для смены цены текущая
+    запись деактивируется и создаётся новая с тем же продуктом.
+    """
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='stripe_prices',
+        verbose_name='Курс'
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='stripe_prices',
+        verbose_name='Урок'
+    )
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name='Сумма'
+    )
+    currency = models.CharField(max_length=3, default='rub', verbose_name='Валюта')
+    stripe_product_id = models.CharField(max_length=100, blank=True, null=True, verbose_name="ID продукта в Stripe")
+    stripe_price_id = models.CharField(max_length=100, blank=True, null=True, verbose_name="ID цены в Stripe")
+    is_active = models.BooleanField(default=True, verbose_name='Действующая цена')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    def __str__(self):
+        return f"{self.course or self.lesson}: {self.amount} {self.currency}"
+
+    class Meta:
+        verbose_name = 'Цена в Stripe'
+        verbose_name_plural = 'Цены в Stripe'
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(course__isnull=False, lesson__isnull=True)
+                | models.Q(course__isnull=True, lesson__isnull=False),
+                name='stripe_price_course_xor_lesson',
+            ),
+            models.UniqueConstraint(
+                fields=['course'], condition=models.Q(is_active=True), name='stripe_price_active_course'
+            ),
+            models.UniqueConstraint(
+                fields=['lesson'], condition=models.Q(is_active=True), name='stripe_price_active_lesson'
+            ),
+        ]
+
+
+class DailyRevenue(models.Model):
+    """
+    Выручка по оплаченным платежам за день по курсу/уроку и способу оплаты.
+
+    Пополняется при переходе платежа в статус paid (users.services.add_revenue),
+    пересчитывается командой rebuild_revenue. Связи без ограничений в БД, чтобы
+    удаление курса или урока не меняло историю выручки.
+    """
+    day = models.DateField(verbose_name='День')
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Курс'
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Урок'
+    )
+    payment_method = models.CharField(
+        max_length=10,
+        choices=Payment.PAYMENT_METHOD_CHOICES,
+        verbose_name='Способ оплаты'
+    )
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма')
+    count = models.PositiveIntegerField(default=0, verbose_name='Количество платежей')
+
+    def __str__(self):
+        return f"{self.day} {self.course_id or self.lesson_id} {self.payment_method}: {self.total}"
+
+    class Meta:
+        verbose_name = 'Выручка за день'
+        verbose_name_plural = 'Выручка по дням'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'course', 'lesson', 'payment_method'],
+                name='daily_revenue_key',
+                nulls_distinct=False,
+            ),
+        ]
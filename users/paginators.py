@@ -0,0 +1,21 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from materials.paginators import CursorModeMixin
+
+
+class PaymentCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-payment_date', '-id')  # Индекс payment_date_id_idx
+
+
+class PaymentPagination(CursorModeMixin, PageNumberPagination):
+    """
+    Список платежей по умолчанию отдаётся целиком, как и раньше.
+    Постранично - только при явном ?page_size= или в режиме курсора.
+    """
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_pagination_class = PaymentCursorPagination
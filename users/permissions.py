@@ -1,5 +1,37 @@
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework.permissions import BasePermission
 
+MODERATORS_GROUP = 'moderators'
+
+
+def moderator_cache_key(user_id):
+    return f'users:moderator:{user_id}'
+
+
+def is_moderator(request):
+    """
+    Проверяет, состоит ли пользователь в группе модераторов.
+
+    Результат запоминается на запросе, а между запросами хранится в кэше и
+    сбрасывается при изменении групп пользователя (users.signals). Для
+    пользователя из JWT с claims роль берётся из токена.
+    """
+    if not hasattr(request, '_is_moderator'):
+        user = request.user
+        if not user.is_authenticated:
+            request._is_moderator = False
+        elif getattr(user, 'moderator_claim', None) is not None:
+            request._is_moderator = user.moderator_claim
+        else:
+            key = moderator_cache_key(user.pk)
+            value = cache.get(key)
+            if value is None:
+                value = user.groups.filter(name=MODERATORS_GROUP).exists()
+                cache.set(key, value, settings.ROLE_CACHE_TIMEOUT)
+            request._is_moderator = value
+    return request._is_moderator
+
 
 class IsOwnerOrStaff(BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -8,7 +40,7 @@ class IsOwnerOrStaff(BasePermission):
 
 class IsModerator(BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='moderators').exists()
+        return is_moderator(request)
 
 
 class IsOwner(BasePermission):
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from users.models import Payment, User
+from users.tokens import ClaimsRefreshToken
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -13,6 +15,32 @@ class PaymentSerializer(serializers.ModelSerializer):
         ]
 
 
+class RevenueQuerySerializer(serializers.Serializer):
+    """Параметры отчёта по выручке: период, фильтры и группировка"""
+    GROUP_FIELDS = ('day', 'course', 'lesson', 'payment_method')
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    course = serializers.IntegerField(required=False, min_value=1)
+    lesson = serializers.IntegerField(required=False, min_value=1)
+    payment_method = serializers.ChoiceField(choices=Payment.PAYMENT_METHOD_CHOICES, required=False)
+    group_by = serializers.CharField(required=False, allow_blank=True, default='day')
+
+    def validate_group_by(self, value):
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = set(fields) - set(self.GROUP_FIELDS)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Неизвестные поля: {', '.join(sorted(unknown))}. Доступны: {', '.join(self.GROUP_FIELDS)}"
+            )
+        return list(dict.fromkeys(fields))
+
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'Конец периода раньше начала'})
+        return attrs
+
+
 class UserSerializers(serializers.ModelSerializer):
     password = serializers.CharField(
         write_only=True,
@@ -35,3 +63,13 @@ class UserSerializers(serializers.ModelSerializer):
         user.set_password(password)
         user.save()
         return user
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдача пары токенов с ролями пользователя в access-токене"""
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновление access-токена с актуальными ролями пользователя"""
+    token_class = ClaimsRefreshToken
@@ -0,0 +1,261 @@
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from materials.models import Course
+from materials.services import (create_stripe_checkout_session, create_stripe_price, create_stripe_product,
+                                get_stripe_session_status)
+from users.models import DailyRevenue, Payment, StripePrice
+
+# Статусы, после которых платёж в Stripe больше не меняется
+FINAL_STATUSES = ('paid', 'expired', 'failed')
+
+
+def _product_field(product):
+    return 'course' if isinstance(product, Course) else 'lesson'
+
+
+def get_catalog_entry(product):
+    """
+    Действующая запись каталога для курса или урока, без обращений к Stripe.
+
+    Создаётся при первой оплате с ценой по умолчанию (DEFAULT_COURSE_PRICE /
+    DEFAULT_LESSON_PRICE).
+    """
+    field = _product_field(product)
+    entry = StripePrice.objects.filter(**{field: product}, is_active=True).first()
+    if entry is None:
+        default_amount = settings.DEFAULT_COURSE_PRICE if field == 'course' else settings.DEFAULT_LESSON_PRICE
+        try:
+            with transaction.atomic():
+                entry = StripePrice.objects.create(**{field: product}, amount=Decimal(default_amount))
+        except IntegrityError:
+            # Запись одновременно создал другой запрос
+            entry = StripePrice.objects.get(**{field: product}, is_active=True)
+    return entry
+
+
+def get_catalog_price(product):
+    """
+    Действующая цена курса или урока с продуктом и ценой в Stripe.
+
+    Продукт и цена в Stripe создаются при первой оплате по записи каталога,
+    дальше обращений к Stripe нет. Возвращает None, если Stripe не создал
+    продукт или цену.
+    """
+    entry = get_catalog_entry(product)
+    if entry.stripe_price_id:
+        return entry
+    return _sync_with_stripe(entry, product)
+
+
+def start_checkout(payment, success_url, cancel_url):
+    """
+    Создаёт сессию оплаты Stripe для платежа и сохраняет её в платеже.
+
+    Возвращает текст ошибки или None при успехе.
+    """
+    price = get_catalog_price(payment.paid_course or payment.paid_lesson)
+    if not price:
+        return "Ошибка при создании цены в Stripe"
+
+    stripe_session = create_stripe_checkout_session(
+        price_id=price.stripe_price_id,
+        success_url=success_url,
+        cancel_url=cancel_url
+    )
+    if not stripe_session:
+        return "Ошибка при создании сессии оплаты"
+
+    payment.stripe_product_id = price.stripe_product_id
+    payment.stripe_price_id = price.stripe_price_id
+    payment.stripe_session_id = stripe_session.id
+    payment.stripe_payment_url = stripe_session.url
+    payment.stripe_payment_status = 'pending'
+    payment.save(update_fields=[
+        'stripe_product_id', 'stripe_price_id', 'stripe_session_id',
+        'stripe_payment_url', 'stripe_payment_status',
+    ])
+    # Только что созданная сессия не оплачена, опрос Stripe можно отложить
+    cache.set(_status_checked_key(payment.pk), True, settings.STRIPE_STATUS_TTL)
+    return None
+
+
+def _status_checked_key(payment_id):
+    return f'users:payment-status-checked:{payment_id}'
+
+
+def session_status(session):
+    """Статус платежа по сессии Checkout: expired для истекших, иначе payment_status"""
+    return 'expired' if session['status'] == 'expired' else session['payment_status']
+
+
+def apply_session_status(session_id, status):
+    """
+    Идемпотентно записывает статус платежа по ID сессии, возвращает число изменённых строк.
+
+    Строка не переписывается, если статус не изменился; оплаченный платёж
+    не меняет статус (события Stripe могут прийти не по порядку). Переход в
+    paid учитывается в выручке в той же транзакции.
+    """
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update()
+            .filter(stripe_session_id=session_id)
+            .exclude(stripe_payment_status__in=(status, 'paid'))
+            .order_by('pk')
+            .only('id', 'amount', 'payment_date', 'paid_course_id', 'paid_lesson_id', 'payment_method')
+        )
+        if not payments:
+            return 0
+        Payment.objects.filter(pk__in=[payment.pk for payment in payments]).update(stripe_payment_status=status)
+        if status == 'paid':
+            add_revenue(payments)
+    return len(payments)
+
+
+def revenue_key(payment):
+    """Ключ строки DailyRevenue для платежа: день по текущему часовому поясу, курс, урок, способ оплаты"""
+    return (
+        timezone.localdate(payment.payment_date),
+        payment.paid_course_id,
+        payment.paid_lesson_id,
+        payment.payment_method,
+    )
+
+
+def add_revenue(payments):
+    """
+    Добавляет оплаченные платежи в DailyRevenue.
+
+    Вызывается в транзакции перехода платежей в paid, ровно один раз на платёж:
+    платежи группируются по ключу и прибавляются одним INSERT ... ON CONFLICT,
+    так что одновременные оплаты не теряют приращения.
+    """
+    totals = defaultdict(lambda: [Decimal(0), 0])
+    for payment in payments:
+        row = totals[revenue_key(payment)]
+        row[0] += payment.amount
+        row[1] += 1
+    if not totals:
+        return
+
+    table = connection.ops.quote_name(DailyRevenue._meta.db_table)
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(totals))
+    params = []
+    # Одинаковый порядок строк во всех транзакциях исключает взаимные блокировки
+    for key in sorted(totals, key=lambda k: (k[0], k[1] or 0, k[2] or 0, k[3])):
+        params.extend([*key, *totals[key]])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (day, course_id, lesson_id, payment_method, total, count)
+            VALUES {values}
+            ON CONFLICT (day, course_id, lesson_id, payment_method)
+            DO UPDATE SET total = {table}.total + EXCLUDED.total, count = {table}.count + EXCLUDED.count
+            """,
+            params,
+        )
+
+
+def refresh_payment_status(payment):
+    """
+    Обновляет статус платежа из Stripe, если он мог устареть.
+
+    Обычно статус приходит вебхуком (StripeWebhookAPIView); Stripe
+    опрашивается не чаще раза в STRIPE_STATUS_TTL секунд на платёж и не
+    опрашивается для платежей в окончательном статусе.
+    """
+    if (not payment.stripe_session_id or payment.stripe_payment_status in FINAL_STATUSES
+            or not cache.add(_status_checked_key(payment.pk), True, settings.STRIPE_STATUS_TTL)):
+        return payment
+
+    session = get_stripe_session_status(payment.stripe_session_id)
+    if session and apply_session_status(payment.stripe_session_id, session_status(session)):
+        payment.refresh_from_db(fields=['stripe_payment_status'])
+    return payment
+
+
+async def arefresh_payment_status(payment):
+    """
+    refresh_payment_status для асинхронных представлений.
+
+    Запрос к Stripe выполняется в отдельном потоке и не занимает общий поток
+    синхронного кода, поэтому ожидание Stripe не блокирует другие запросы.
+    """
+    if (not payment.stripe_session_id or payment.stripe_payment_status in FINAL_STATUSES
+            or not await cache.aadd(_status_checked_key(payment.pk), True, settings.STRIPE_STATUS_TTL)):
+        return payment
+
+    session = await sync_to_async(get_stripe_session_status, thread_sensitive=False)(payment.stripe_session_id)
+    if session and await sync_to_async(apply_session_status)(payment.stripe_session_id, session_status(session)):
+        await payment.arefresh_from_db(fields=['stripe_payment_status'])
+    return payment
+
+
+def _catalog_idempotency_key(entry, kind, **params):
+    """
+    Ключ идемпотентности Stripe для записи каталога и параметров запроса.
+
+    Stripe отклоняет повтор ключа с другими параметрами, поэтому параметры
+    входят в ключ: после смены названия или описания создаётся новый объект,
+    а не ошибка. Ключи общие для аккаунта: соль SECRET_KEY разводит
+    окружения с одним аккаунтом.
+    """
+    value = json.dumps({'entry': entry.pk, 'kind': kind, **params}, sort_keys=True, default=str)
+    return salted_hmac('users.services.stripe-catalog', value).hexdigest()
+
+
+def _sync_with_stripe(entry, product):
+    """
+    Создаёт в Stripe недостающие продукт и цену записи каталога.
+
+    Запросы к Stripe выполняются вне транзакции: ключи идемпотентности
+    построены по записи, поэтому одновременные запросы получают от Stripe
+    те же продукт и цену. Строка блокируется только для сохранения ID;
+    если их уже сохранил другой запрос, остаются сохранённые.
+    """
+    product_id = entry.stripe_product_id or (
+        # Продукт переиспользуется из прежних цен того же курса или урока
+        StripePrice.objects.filter(**{_product_field(product): product}, stripe_product_id__isnull=False)
+        .values_list('stripe_product_id', flat=True).first()
+    )
+    if not product_id:
+        stripe_product = create_stripe_product(
+            name=product.title,
+            description=product.description,
+            idempotency_key=_catalog_idempotency_key(
+                entry, 'product', name=product.title, description=product.description
+            ),
+        )
+        if not stripe_product:
+            return None
+        product_id = stripe_product.id
+        # Продукт сохраняется сразу: при ошибке создания цены его не придётся создавать снова
+        StripePrice.objects.filter(pk=entry.pk, stripe_product_id__isnull=True).update(stripe_product_id=product_id)
+
+    stripe_price = create_stripe_price(
+        product_id=product_id,
+        amount=entry.amount,
+        currency=entry.currency,
+        idempotency_key=_catalog_idempotency_key(
+            entry, 'price', product=product_id, amount=entry.amount, currency=entry.currency
+        ),
+    )
+    if not stripe_price:
+        return None
+
+    with transaction.atomic():
+        entry = StripePrice.objects.select_for_update().get(pk=entry.pk)
+        if not entry.stripe_price_id:
+            entry.stripe_product_id = product_id
+            entry.stripe_price_id = stripe_price.id
+            entry.save(update_fields=['stripe_product_id', 'stripe_price_id'])
+    return entry
@@ -0,0 +1,46 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.authentication import revoke_tokens
+from users.models import User
+from users.permissions import moderator_cache_key
+
+
+def invalidate_roles(user_ids):
+    cache.delete_many([moderator_cache_key(user_id) for user_id in user_ids])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кэш роли при добавлении/удалении групп пользователя (с любой стороны связи)"""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_roles([instance.pk])
+    elif action == 'pre_clear':
+        # При очистке группы pk_set не передаётся, участников берём до удаления
+        invalidate_roles(instance.user_set.values_list('pk', flat=True))
+    else:
+        invalidate_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, instance, **kwargs):
+    """Переименование или удаление группы меняет роль всех её участников"""
+    invalidate_roles(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_deactivation(sender, instance, **kwargs):
+    """Токены деактивированного пользователя перестают приниматься сразу, без проверки в БД"""
+    if not instance.is_active:
+        revoke_tokens([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    """Токены удалённого пользователя не проходят аутентификацию по claims до истечения срока"""
+    revoke_tokens([instance.pk])
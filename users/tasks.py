@@ -1,34 +1,63 @@
+import time
+
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth import get_user_model
 
+from users.authentication import revoke_tokens
+from users.models import Payment
+from materials.outbox import claim_message
+from materials.services import iter_checkout_sessions
+from users.services import FINAL_STATUSES, add_revenue, session_status, start_checkout
+
 User = get_user_model()
 
 
 @shared_task
-def deactivate_inactive_users():
+def deactivate_inactive_users(chunk_size=None):
     """
-    Задача для деактивации пользователей, которые не заходили более месяца
+    Задача для деактивации пользователей, которые не заходили более INACTIVE_USER_DAYS дней.
+
+    Пользователи, ни разу не входившие в систему, проверяются по дате
+    регистрации. Обработка идёт пакетами по первичному ключу, каждый пакет -
+    отдельная транзакция, поэтому таблица не блокируется надолго.
+
+    Возвращает статистику: chunks, rows, elapsed (секунды) и error при ошибке.
     """
+    chunk_size = chunk_size or settings.DEACTIVATION_CHUNK_SIZE
+    started = time.monotonic()
+    stats = {'chunks': 0, 'rows': 0}
     try:
-        # Вычисляем дату, которая была 30 дней назад
-        thirty_days_ago = timezone.now() - timedelta(days=30)
+        # Вычисляем дату, после которой пользователь считается активным
+        cutoff = timezone.now() - timedelta(days=settings.INACTIVE_USER_DAYS)
 
-        # Находим пользователей, которые не заходили более месяца и еще активны
+        # Находим пользователей, которые не заходили с этой даты и еще активны
         inactive_users = User.objects.filter(
-            last_login__lt=thirty_days_ago,
-            is_active=True
-        )
-
-        # Деактивируем пользователей
-        count = inactive_users.count()
-        inactive_users.update(is_active=False)
+            Q(last_login__lt=cutoff) | Q(last_login__isnull=True, date_joined__lt=cutoff),
+            is_active=True,
+        ).order_by('pk')
 
-        return f"Деактивировано {count} неактивных пользователей"
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                user_ids = list(inactive_users.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+                if not user_ids:
+                    break
+                # Деактивируем пользователей; update() не шлёт post_save, поэтому токены отзываем явно
+                stats['rows'] += User.objects.filter(pk__in=user_ids, is_active=True).update(is_active=False)
+            revoke_tokens(user_ids)
+            stats['chunks'] += 1
+            last_pk = user_ids[-1]
 
     except Exception as e:
-        return f"Ошибка при деактивации неактивных пользователей: {str(e)}"
+        stats['error'] = f"Ошибка при деактивации неактивных пользователей: {str(e)}"
+
+    stats['elapsed'] = round(time.monotonic() - started, 3)
+    return stats
 
 
 @shared_task
@@ -37,3 +66,93 @@ def check_user_activity():
     Общая задача для проверки активности пользователей
     """
     return deactivate_inactive_users()
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+def create_checkout_session(self, payment_id, success_url, cancel_url):
+    """
+    Создание сессии оплаты Stripe для платежа в статусе creating.
+
+    Повторный запуск для уже обработанного платежа ничего не делает, повторно
+    опубликованное сообщение outbox пропускается. Если Stripe недоступен,
+    задача повторяется, после исчерпания попыток платёж получает статус failed.
+    """
+    if not self.request.retries and not claim_message(self.request.id):
+        return f"Сообщение {self.request.id} уже обработано"
+
+    payment = Payment.objects.select_related('paid_course', 'paid_lesson').filter(
+        id=payment_id, stripe_payment_status='creating'
+    ).first()
+    if payment is None:
+        return f"Платеж {payment_id} уже обработан"
+
+    error = start_checkout(payment, success_url, cancel_url)
+    if error is None:
+        return f"Сессия оплаты для платежа {payment_id} создана"
+
+    if self.request.retries < self.max_retries:
+        raise self.retry()
+    payment.stripe_payment_status = 'failed'
+    payment.save(update_fields=['stripe_payment_status'])
+    return f"{error} (платеж {payment_id})"
+
+
+@shared_task
+def reconcile_payment_statuses(hours=None):
+    """
+    Сверка статусов незавершённых платежей со Stripe.
+
+    Сессии Checkout читаются списком по 100 начиная с создания самого старого
+    незавершённого платежа, но не раньше hours часов назад (по умолчанию
+    PAYMENT_RECONCILE_WINDOW_HOURS). Изменённые статусы сопоставляются с
+    платежами одним запросом и записываются через bulk_update.
+
+    Незавершённые платежи старше окна не сверяются и считаются в
+    outside_window; для разовой сверки старых платежей задача запускается с
+    большим hours, например reconcile_payment_statuses.delay(hours=24 * 90).
+
+    Возвращает статистику: pages, sessions, updated, outside_window и error,
+    если Stripe недоступен.
+    """
+    stats = {'pages': 0, 'sessions': 0, 'updated': 0, 'outside_window': 0}
+    pending = Payment.objects.filter(stripe_session_id__isnull=False).exclude(
+        stripe_payment_status__in=FINAL_STATUSES
+    )
+    if hours is None:
+        hours = settings.PAYMENT_RECONCILE_WINDOW_HOURS
+    window_start = timezone.now() - timedelta(hours=hours)
+    state = pending.aggregate(
+        oldest=Min('payment_date'),
+        outside_window=Count('id', filter=Q(payment_date__lt=window_start)),
+    )
+    if state['oldest'] is None:
+        return stats
+
+    stats['outside_window'] = state['outside_window']
+    since = max(state['oldest'], window_start)
+    statuses = {}
+    for sessions in iter_checkout_sessions(int(since.timestamp()) - 60):
+        if sessions is None:
+            stats['error'] = "Stripe недоступен, сверка прервана"
+            break
+        stats['pages'] += 1
+        stats['sessions'] += len(sessions)
+        for session in sessions:
+            # Открытые сессии ещё не оплачены и не истекли - менять нечего
+            if session['status'] != 'open':
+                statuses[session['id']] = session_status(session)
+
+    changed = []
+    with transaction.atomic():
+        # Блокировка строк не даёт вебхуку одновременно учесть ту же оплату в выручке
+        for payment in pending.filter(stripe_session_id__in=list(statuses)).select_for_update().order_by('pk').only(
+                'id', 'stripe_session_id', 'stripe_payment_status', 'amount', 'payment_date',
+                'paid_course_id', 'paid_lesson_id', 'payment_method'):
+            status = statuses[payment.stripe_session_id]
+            if payment.stripe_payment_status != status:
+                payment.stripe_payment_status = status
+                changed.append(payment)
+        Payment.objects.bulk_update(changed, ['stripe_payment_status'], batch_size=500)
+        add_revenue([payment for payment in changed if payment.stripe_payment_status == 'paid'])
+    stats['updated'] = len(changed)
+    return stats
@@ -1,3 +1,790 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import hmac
+import importlib
+import io
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import orjson
+from asgiref.sync import async_to_sync
+import stripe
+from django.apps import apps
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.celery import app as celery_app
+from config.parsers import ORJSONParser
+from config.renderers import ORJSONRenderer
+from users.authentication import ClaimsJWTAuthentication
+from materials.models import Course
+from materials.services import breaker
+from users.models import DailyRevenue, Payment, StripePrice, User
+from users.permissions import is_moderator
+from users.serializers import PaymentSerializer
+from users.services import apply_session_status, get_catalog_entry, get_catalog_price
+from users.tasks import deactivate_inactive_users, reconcile_payment_statuses
+from users.views import AsyncPaymentStatusAPIView
+
+
+class PaymentListTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.user.set_password('test')
+        self.user.save()
+
+        for method in ['cash', 'transfer', 'cash']:
+            Payment.objects.create(
+                user=self.user,
+                amount=1000,
+                payment_method=method
+            )
+
+    def test_payment_list_unpaginated_by_default(self):
+        """Тест получения всего списка платежей без пагинации"""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(
+            reverse('users:payment-list')
+        )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        self.assertEqual(len(response.data), 3)
+
+    def test_payment_list_cursor(self):
+        """Тест keyset-пагинации платежей с фильтром"""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(
+            reverse('users:payment-list'),
+            {'pagination': 'cursor', 'page_size': 1, 'payment_method': 'cash'}
+        )
+        first = response.data['results'][0]['id']
+
+        response = self.client.get(response.data['next'])
+        second = response.data['results'][0]['id']
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            [first, second],
+            list(Payment.objects.filter(payment_method='cash')
+                 .order_by('-payment_date', '-id').values_list('id', flat=True))
+        )
+
+
+class ORJSONTestCase(APITestCase):
+    def test_renderer_matches_drf(self):
+        """Тест побайтного совпадения ORJSONRenderer и JSONRenderer DRF"""
+        user = User.objects.create(email='user@test.com')
+        Payment.objects.create(user=user, amount=Decimal('15000.50'), payment_method='transfer')
+        data = {
+            'payments': PaymentSerializer(Payment.objects.all(), many=True).data,
+            'amount': Decimal('10.25'),
+            'created_at': datetime.datetime(2025, 8, 26, 18, 0, 0, 123456, tzinfo=datetime.timezone.utc),
+            'local': timezone.localtime(timezone.now()),
+            'date': datetime.date(2025, 8, 26),
+            'message': gettext_lazy('Оплата отменена'),
+            'separator': 'a\u2028b',
+            1: None,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4')
+        )
+
+    def test_renderer_non_finite_floats(self):
+        """Тест NaN и бесконечности: ValueError при STRICT_JSON, как у JSONRenderer DRF"""
+        for value in (float('nan'), float('inf'), -float('inf'), Decimal('NaN')):
+            data = {'total': [value], 'empty': None}
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render(data)
+                with self.assertRaises(ValueError):
+                    ORJSONRenderer().render(data)
+
+        class LenientORJSONRenderer(ORJSONRenderer):
+            strict = False
+
+        class LenientJSONRenderer(JSONRenderer):
+            strict = False
+
+        data = {'total': float('nan'), 'max': float('inf')}
+        self.assertEqual(LenientORJSONRenderer().render(data), LenientJSONRenderer().render(data))
+
+    def test_parser(self):
+        """Тест разбора JSON и ошибок разбора"""
+        parser = ORJSONParser()
+        self.assertEqual(
+            parser.parse(io.BytesIO('{"title": "Курс", "price": 1.5}'.encode())),
+            {'title': 'Курс', 'price': 1.5}
+        )
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"price": NaN}'))
+
+    def test_api_uses_orjson(self):
+        """Тест JSON-запроса и ответа API через orjson"""
+        response = self.client.post(
+            reverse('users:register'),
+            data={'email': 'new@test.com', 'password': 'Str0ng-pass!'},
+            format='json'
+        )
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED
+        )
+        self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+        self.assertEqual(response.json()['email'], 'new@test.com')
+
+
+class PaymentExportTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(
+            email='admin@test.com',
+            is_staff=True
+        )
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        for amount, method in [(1000, 'cash'), (2000, 'transfer'), (3000, 'cash')]:
+            Payment.objects.create(
+                user=self.user,
+                amount=amount,
+                payment_method=method
+            )
+
+    def export(self, **params):
+        response = self.client.get(reverse('users:payment-export'), params)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK
+        )
+        return response, b''.join(response.streaming_content)
+
+    def test_export_ndjson(self):
+        """Тест потоковой выгрузки NDJSON с фильтром и сортировкой"""
+        self.client.force_authenticate(user=self.admin)
+        response, content = self.export(payment_method='cash', ordering='payment_date')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [orjson.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['amount'] for row in rows], ['1000.00', '3000.00'])
+
+        expected = PaymentSerializer(Payment.objects.order_by('payment_date'), many=True).data
+        self.assertEqual(rows[0], orjson.loads(ORJSONRenderer().render(expected[0])))
+
+    def test_export_csv(self):
+        """Тест потоковой выгрузки CSV"""
+        self.client.force_authenticate(user=self.admin)
+        response, content = self.export(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'user', 'payment_date'])
+        self.assertEqual(len(lines), 4)
+
+    def test_export_requires_staff(self):
+        """Тест запрета выгрузки обычному пользователю"""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('users:payment-export'))
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_403_FORBIDDEN
+        )
+
+
+class ModeratorRoleTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            email='user@test.com'
+        )
+        self.group = Group.objects.create(name='moderators')
+
+    def make_request(self):
+        request = APIRequestFactory().get('/')
+        request.user = self.user
+        return request
+
+    def test_role_cached_between_requests(self):
+        """Тест отсутствия запросов к БД при повторной проверке роли"""
+        with self.assertNumQueries(1):
+            self.assertFalse(is_moderator(self.make_request()))
+        with self.assertNumQueries(0):
+            request = self.make_request()
+            self.assertFalse(is_moderator(request))
+            self.assertFalse(is_moderator(request))
+
+    def test_role_invalidated_on_groups_change(self):
+        """Тест сброса кэша роли при изменении групп пользователя"""
+        self.assertFalse(is_moderator(self.make_request()))
+
+        self.user.groups.add(self.group)
+        self.assertTrue(is_moderator(self.make_request()))
+
+        self.group.user_set.remove(self.user)
+        self.assertFalse(is_moderator(self.make_request()))
+
+        self.group.user_set.add(self.user)
+        self.assertTrue(is_moderator(self.make_request()))
+
+        self.group.user_set.clear()
+        self.assertFalse(is_moderator(self.make_request()))
+
+        self.user.groups.add(self.group)
+        self.assertTrue(is_moderator(self.make_request()))
+        self.group.delete()
+        self.assertFalse(is_moderator(self.make_request()))
+
+
+class ClaimsJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='user@test.com', password='password')
+        self.group = Group.objects.create(name='moderators')
+
+    def login(self):
+        response = self.client.post(
+            reverse('users:login'), {'email': 'user@test.com', 'password': 'password'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def user_queries(self, queries):
+        return [query['sql'] for query in queries if '"users_user"' in query['sql']]
+
+    def test_no_user_query_on_request(self):
+        """Тест аутентификации по claims без запроса пользователя и проверки роли"""
+        self.user.groups.add(self.group)
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('materials:course-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.user_queries(queries.captured_queries), [])
+        self.assertNotIn('auth_group', ' '.join(query['sql'] for query in queries.captured_queries))
+
+    def test_full_user_loaded_lazily(self):
+        """Тест загрузки остальных полей пользователя одним запросом при обращении"""
+        access = self.login()['access']
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        user, _ = ClaimsJWTAuthentication().authenticate(request)
+
+        self.assertEqual(user, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'user@test.com')
+            self.assertIsNotNone(user.date_joined)
+            self.assertIsNone(user.city)
+
+    def test_deactivated_user_rejected(self):
+        """Тест отзыва токенов при деактивации пользователя задачей"""
+        access = self.login()['access']
+        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now() - datetime.timedelta(days=31))
+        deactivate_inactive_users()
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.get(reverse('materials:course-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_rejected(self):
+        """Тест отзыва токенов при удалении пользователя"""
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.delete(reverse('users:user-delete', kwargs={'pk': self.user.pk}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(reverse('materials:course-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_without_claims(self):
+        """Тест проверки токенов, выданных до появления claims, через БД"""
+        access = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.get(reverse('materials:course-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('materials:course-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_updates_claims(self):
+        """Тест обновления ролей в access-токене при обновлении токена"""
+        tokens = self.login()
+        self.assertFalse(AccessToken(tokens['access'])['is_moderator'])
+
+        self.user.groups.add(self.group)
+        response = self.client.post(reverse('users:token_refresh'), {'refresh': tokens['refresh']})
+        self.assertTrue(AccessToken(response.json()['access'])['is_moderator'])
+
+
+class DeactivateInactiveUsersTestCase(APITestCase):
+    def setUp(self):
+        now = timezone.now()
+        old = now - datetime.timedelta(days=31)
+        self.active = User.objects.create(email='active@test.com', last_login=now)
+        self.inactive = User.objects.create(email='inactive@test.com', last_login=old)
+        self.never_logged_old = User.objects.create(email='never-old@test.com')
+        self.never_logged_new = User.objects.create(email='never-new@test.com')
+        User.objects.filter(pk=self.never_logged_old.pk).update(date_joined=old)
+
+    def test_chunked_deactivation(self):
+        """Тест деактивации пакетами, включая не входивших пользователей, и статистики"""
+        stats = deactivate_inactive_users(chunk_size=1)
+        self.assertEqual(stats['chunks'], 2)
+        self.assertEqual(stats['rows'], 2)
+        self.assertNotIn('error', stats)
+        self.assertGreaterEqual(stats['elapsed'], 0)
+
+        self.assertEqual(
+            set(User.objects.filter(is_active=False).values_list('email', flat=True)),
+            {'inactive@test.com', 'never-old@test.com'}
+        )
+        self.assertEqual(deactivate_inactive_users()['rows'], 0)
+
+    def test_login_updates_last_login(self):
+        """Тест обновления last_login при входе по JWT"""
+        self.never_logged_old.set_password('password')
+        self.never_logged_old.save()
+        self.client.post(reverse('users:login'), {'email': 'never-old@test.com', 'password': 'password'})
+
+        deactivate_inactive_users()
+        self.never_logged_old.refresh_from_db()
+        self.assertTrue(self.never_logged_old.is_active)
+
+    def test_existing_users_backfilled(self):
+        """Тест миграции: пользователи до включения last_login не деактивируются по дате регистрации"""
+        migration = importlib.import_module('users.migrations.0011_backfill_user_last_login')
+        with override_settings(DEACTIVATION_CHUNK_SIZE=1), CaptureQueriesContext(connection) as queries:
+            migration.backfill_last_login(apps, None)
+        # По пакету на каждого из двух пользователей без last_login
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+
+        self.never_logged_old.refresh_from_db()
+        self.assertIsNotNone(self.never_logged_old.last_login)
+        stats = deactivate_inactive_users()
+        self.assertEqual(stats['rows'], 1)
+        self.assertEqual(list(User.objects.filter(is_active=False).values_list('email', flat=True)),
+                         ['inactive@test.com'])
+
+
+@override_settings(STRIPE_ASYNC_CHECKOUT=False)
+class StripeCatalogTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='user@test.com')
+        self.course = Course.objects.create(title='Test Course', owner=self.user)
+        self.client.force_authenticate(user=self.user)
+
+        breaker.record_success()
+        patcher = mock.patch('materials.services.get_client')
+        self.stripe = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.stripe.products.create.return_value = mock.Mock(id='prod_1')
+        self.stripe.prices.create.return_value = mock.Mock(id='price_1')
+        self.stripe.checkout.sessions.create.return_value = mock.Mock(
+            id='cs_1', url='https://checkout.stripe.com/c/cs_1'
+        )
+
+    def test_product_and_price_reused(self):
+        """Тест создания продукта и цены в Stripe только при первой оплате"""
+        for _ in range(2):
+            response = self.client.post(reverse('users:payment-create'), {'course_id': self.course.id})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.data['stripe_price_id'], 'price_1')
+            self.assertEqual(Decimal(response.data['amount']), Decimal('15000'))
+
+        self.assertEqual(self.stripe.products.create.call_count, 1)
+        self.assertEqual(self.stripe.prices.create.call_count, 1)
+        self.assertEqual(self.stripe.checkout.sessions.create.call_count, 2)
+
+    def test_new_price_reuses_product(self):
+        """Тест новой цены с тем же продуктом при смене суммы"""
+        self.client.post(reverse('users:payment-create'), {'course_id': self.course.id})
+        StripePrice.objects.update(is_active=False)
+        StripePrice.objects.create(course=self.course, amount=Decimal('9900'))
+        self.stripe.prices.create.return_value = mock.Mock(id='price_2')
+
+        response = self.client.post(reverse('users:payment-create'), {'course_id': self.course.id})
+        self.assertEqual(response.data['stripe_price_id'], 'price_2')
+        self.assertEqual(Decimal(response.data['amount']), Decimal('9900'))
+        self.assertEqual(self.stripe.products.create.call_count, 1)
+        params, _ = self.stripe.prices.create.call_args[0]
+        self.assertEqual(params, {'product': 'prod_1', 'unit_amount': 990000, 'currency': 'rub'})
+
+    def test_concurrent_sync_keeps_stored_price(self):
+        """Тест создания в Stripe вне блокировки: ключи по записи, сохранённая другим запросом цена остаётся"""
+        entry = get_catalog_entry(self.course)
+
+        def create_price(params, options):
+            queries_before_stripe.append(len(queries.captured_queries))
+            # Другой запрос успел сохранить цену, пока этот ждал Stripe
+            StripePrice.objects.filter(pk=entry.pk).update(stripe_product_id='prod_1', stripe_price_id='price_1')
+            return mock.Mock(id='price_1')
+
+        queries_before_stripe = []
+        self.stripe.prices.create.side_effect = create_price
+        with CaptureQueriesContext(connection) as queries:
+            price = get_catalog_price(self.course)
+        self.assertEqual(price.stripe_price_id, 'price_1')
+        # Блокировка берётся только после обращений к Stripe
+        locks = [index for index, query in enumerate(queries.captured_queries) if 'FOR UPDATE' in query['sql']]
+        self.assertEqual(len(locks), 1)
+        self.assertGreater(locks[0], queries_before_stripe[0])
+
+        StripePrice.objects.filter(pk=entry.pk).update(stripe_price_id=None)
+        get_catalog_price(self.course)
+        product_keys = [call.args[1]['idempotency_key'] for call in self.stripe.products.create.call_args_list]
+        price_keys = [call.args[1]['idempotency_key'] for call in self.stripe.prices.create.call_args_list]
+        self.assertEqual(len(product_keys), 1)
+        self.assertEqual(len(set(price_keys)), 1)
+        self.assertEqual(len(price_keys), 2)
+        self.assertNotEqual(product_keys[0], price_keys[0])
+
+    def test_changed_params_get_new_idempotency_key(self):
+        """Тест нового ключа идемпотентности после смены названия до успешного создания продукта"""
+        self.stripe.products.create.return_value = None
+        self.assertIsNone(get_catalog_price(self.course))
+        self.assertIsNone(get_catalog_price(self.course))
+
+        Course.objects.filter(pk=self.course.pk).update(title='Renamed Course')
+        self.course.refresh_from_db()
+        self.stripe.products.create.return_value = mock.Mock(id='prod_1')
+        self.assertEqual(get_catalog_price(self.course).stripe_price_id, 'price_1')
+
+        keys = [call.args[1]['idempotency_key'] for call in self.stripe.products.create.call_args_list]
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[1], keys[2])
+
+
+@override_settings(STRIPE_ASYNC_CHECKOUT=True, OUTBOX_RELAY_IN_THREAD=False)
+class AsyncCheckoutTestCase(APITestCase):
+    def setUp(self):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+        self.user = User.objects.create(email='user@test.com')
+        self.course = Course.objects.create(title='Test Course', owner=self.user)
+        self.client.force_authenticate(user=self.user)
+
+        breaker.record_success()
+        patcher = mock.patch('materials.services.get_client')
+        self.stripe = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.stripe.products.create.return_value = mock.Mock(id='prod_1')
+        self.stripe.prices.create.return_value = mock.Mock(id='price_1')
+        self.stripe.checkout.sessions.create.return_value = mock.Mock(
+            id='cs_1', url='https://checkout.stripe.com/c/cs_1'
+        )
+
+    def test_accepted_then_polled(self):
+        """Тест ответа 202 без обращений к Stripe и получения ссылки из статуса платежа"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('users:payment-create'), {'course_id': self.course.id})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['stripe_payment_status'], 'creating')
+        self.assertEqual(Decimal(response.data['amount']), Decimal('15000'))
+        self.stripe.checkout.sessions.create.assert_not_called()
+
+        status_url = reverse('users:payment-status', kwargs={'payment_id': response.data['id']})
+        self.assertEqual(self.client.get(status_url).data['stripe_payment_status'], 'creating')
+        self.stripe.checkout.sessions.retrieve.assert_not_called()
+
+        # Публикация outbox после фиксации транзакции запускает задачу
+        for callback in callbacks:
+            callback()
+        payment = Payment.objects.get(pk=response.data['id'])
+        self.assertEqual(payment.stripe_payment_status, 'pending')
+        self.assertEqual(payment.stripe_payment_url, 'https://checkout.stripe.com/c/cs_1')
+
+    @override_settings(STRIPE_MAX_RETRIES=0)
+    def test_failed_after_retries(self):
+        """Тест статуса failed, если Stripe не создал сессию"""
+        self.stripe.checkout.sessions.create.side_effect = stripe.error.APIConnectionError('down')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('users:payment-create'), {'course_id': self.course.id})
+        self.assertEqual(Payment.objects.get(pk=response.data['id']).stripe_payment_status, 'failed')
+        self.assertEqual(self.stripe.checkout.sessions.create.call_count, 4)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test', STRIPE_STATUS_TTL=60)
+class StripeWebhookTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='user@test.com')
+        self.payment = Payment.objects.create(
+            user=self.user,
+            amount=Decimal('15000'),
+            payment_method='transfer',
+            stripe_session_id='cs_1',
+            stripe_payment_status='unpaid',
+        )
+        self.url = reverse('users:stripe-webhook')
+
+    def send_event(self, event_type, session, secret='whsec_test'):
+        payload = orjson.dumps({
+            'id': 'evt_1',
+            'object': 'event',
+            'type': event_type,
+            'data': {'object': {'object': 'checkout.session', **session}},
+        }).decode()
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post(
+            self.url, payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}',
+        )
+
+    def test_completed_event_idempotent(self):
+        """Тест обновления статуса событием и повторной доставки без изменений"""
+        session = {'id': 'cs_1', 'status': 'complete', 'payment_status': 'paid'}
+        response = self.send_event('checkout.session.completed', session)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.stripe_payment_status, 'paid')
+
+        # Транзакция с блокирующим чтением, без записи
+        with self.assertNumQueries(3):
+            self.send_event('checkout.session.completed', session)
+        # Запоздавшее событие не отменяет оплату
+        self.send_event('checkout.session.expired', {'id': 'cs_1', 'status': 'expired', 'payment_status': 'unpaid'})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.stripe_payment_status, 'paid')
+
+    def test_invalid_signature_rejected(self):
+        """Тест отклонения события с неверной подписью"""
+        response = self.send_event(
+            'checkout.session.completed', {'id': 'cs_1', 'status': 'complete', 'payment_status': 'paid'},
+            secret='whsec_other',
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.stripe_payment_status, 'unpaid')
+
+    @mock.patch('materials.services.get_client')
+    def test_status_polls_stripe_after_ttl(self, get_client):
+        """Тест ответа статуса из БД и запроса к Stripe не чаще раза за TTL"""
+        retrieve = get_client.return_value.checkout.sessions.retrieve
+        retrieve.return_value = {'id': 'cs_1', 'status': 'open', 'payment_status': 'unpaid'}
+        self.client.force_authenticate(user=self.user)
+        url = reverse('users:payment-status', kwargs={'payment_id': self.payment.id})
+
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).data['stripe_payment_status'], 'unpaid')
+        self.assertEqual(retrieve.call_count, 1)
+
+        self.send_event('checkout.session.completed', {'id': 'cs_1', 'status': 'complete', 'payment_status': 'paid'})
+        cache.clear()
+        self.assertEqual(self.client.get(url).data['stripe_payment_status'], 'paid')
+        self.assertEqual(retrieve.call_count, 1)
+
+    @mock.patch('materials.services.get_client')
+    def test_async_status_view(self, get_client):
+        """Тест асинхронного представления статуса: обновление из Stripe и 404 для чужого платежа"""
+        get_client.return_value.checkout.sessions.retrieve.return_value = {
+            'id': 'cs_1', 'status': 'complete', 'payment_status': 'paid'
+        }
+        view = AsyncPaymentStatusAPIView.as_view()
+        factory = APIRequestFactory()
+
+        request = factory.get('/payments/status/')
+        force_authenticate(request, user=self.user)
+        response = async_to_sync(view)(request, payment_id=self.payment.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, PaymentSerializer(Payment.objects.get(pk=self.payment.pk)).data)
+        self.assertEqual(response.data['stripe_payment_status'], 'paid')
+        self.assertEqual(DailyRevenue.objects.get().count, 1)
+
+        request = factory.get('/payments/status/')
+        force_authenticate(request, user=User.objects.create(email='other@test.com'))
+        response = async_to_sync(view)(request, payment_id=self.payment.id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @mock.patch('materials.services.get_client')
+    def test_success_page_does_not_trust_query(self, get_client):
+        """Тест: страница успеха не отмечает платёж оплаченным без подтверждения Stripe"""
+        get_client.return_value.checkout.sessions.retrieve.return_value = {
+            'id': 'cs_1', 'status': 'open', 'payment_status': 'unpaid'
+        }
+        self.client.get(reverse('users:payment-success'), {'session_id': 'cs_1'})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.stripe_payment_status, 'unpaid')
+
+
+class ReconcilePaymentStatusesTestCase(APITestCase):
+    def setUp(self):
+        breaker.record_success()
+        self.user = User.objects.create(email='user@test.com')
+        for session_id, payment_status in (('cs_1', 'pending'), ('cs_2', 'pending'), ('cs_3', 'unpaid'),
+                                           ('cs_4', 'paid')):
+            Payment.objects.create(
+                user=self.user,
+                amount=Decimal('2000'),
+                payment_method='transfer',
+                stripe_session_id=session_id,
+                stripe_payment_status=payment_status,
+            )
+
+    @mock.patch('materials.services.get_client')
+    def test_reconcile_by_pages(self, get_client):
+        """Тест сверки по страницам списка сессий одним запросом сопоставления и bulk_update"""
+        sessions = get_client.return_value.checkout.sessions
+        sessions.list.side_effect = [
+            {'data': [{'id': 'cs_1', 'status': 'complete', 'payment_status': 'paid'},
+                      {'id': 'cs_2', 'status': 'open', 'payment_status': 'unpaid'}], 'has_more': True},
+            {'data': [{'id': 'cs_3', 'status': 'expired', 'payment_status': 'unpaid'},
+                      {'id': 'cs_4', 'status': 'expired', 'payment_status': 'unpaid'},
+                      {'id': 'cs_other', 'status': 'complete', 'payment_status': 'paid'}], 'has_more': False},
+        ]
+
+        # Самый старый платёж, затем в транзакции: сопоставление, обновление и выручка
+        with self.assertNumQueries(6):
+            stats = reconcile_payment_statuses()
+        self.assertEqual(stats, {'pages': 2, 'sessions': 5, 'updated': 2, 'outside_window': 0})
+        self.assertEqual(sessions.list.call_args_list[1][0][0]['starting_after'], 'cs_2')
+        self.assertEqual(sessions.list.call_args_list[0][0][0]['limit'], 100)
+
+        self.assertEqual(
+            dict(Payment.objects.values_list('stripe_session_id', 'stripe_payment_status')),
+            {'cs_1': 'paid', 'cs_2': 'pending', 'cs_3': 'expired', 'cs_4': 'paid'}
+        )
+
+    @mock.patch('materials.services.get_client')
+    def test_pending_outside_window(self, get_client):
+        """Тест учёта платежей старше окна в статистике и их сверки с большим hours"""
+        old = timezone.now() - datetime.timedelta(days=10)
+        Payment.objects.filter(stripe_session_id='cs_1').update(payment_date=old)
+        sessions = get_client.return_value.checkout.sessions
+        # Stripe отдаёт сессию только при запросе с её даты создания
+        sessions.list.side_effect = [
+            {'data': [], 'has_more': False},
+            {'data': [{'id': 'cs_1', 'status': 'complete', 'payment_status': 'paid'}], 'has_more': False},
+        ]
+
+        stats = reconcile_payment_statuses()
+        self.assertEqual(stats['outside_window'], 1)
+        self.assertEqual(stats['updated'], 0)
+        created_after = sessions.list.call_args[0][0]['created']['gte']
+        self.assertGreater(created_after, old.timestamp())
+
+        stats = reconcile_payment_statuses(hours=24 * 30)
+        self.assertEqual(stats['outside_window'], 0)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(sessions.list.call_args[0][0]['created']['gte'], int(old.timestamp()) - 60)
+        self.assertEqual(Payment.objects.get(stripe_session_id='cs_1').stripe_payment_status, 'paid')
+
+    @mock.patch('materials.services.get_client')
+    def test_nothing_pending(self, get_client):
+        """Тест отсутствия обращений к Stripe без незавершённых платежей"""
+        Payment.objects.update(stripe_payment_status='paid')
+        self.assertEqual(reconcile_payment_statuses()['pages'], 0)
+        get_client.return_value.checkout.sessions.list.assert_not_called()
+
+
+class DailyRevenueTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='user@test.com')
+        self.admin = User.objects.create(email='admin@test.com', is_staff=True)
+        self.course = Course.objects.create(title='Курс')
+        self.other_course = Course.objects.create(title='Другой курс')
+        self.url = reverse('users:payment-revenue')
+        self.yesterday = timezone.now() - datetime.timedelta(days=1)
+
+    def create_payment(self, session_id, amount, course=None, payment_method='transfer', payment_date=None):
+        payment = Payment.objects.create(
+            user=self.user,
+            paid_course=course or self.course,
+            amount=Decimal(amount),
+            payment_method=payment_method,
+            stripe_session_id=session_id,
+            stripe_payment_status='pending',
+        )
+        if payment_date:
+            Payment.objects.filter(pk=payment.pk).update(payment_date=payment_date)
+        return payment
+
+    def rollups(self):
+        return set(DailyRevenue.objects.values_list('day', 'course_id', 'payment_method', 'total', 'count'))
+
+    def test_paid_counted_once(self):
+        """Тест учёта оплаты в выручке один раз при повторных и запоздавших событиях"""
+        self.create_payment('cs_1', '15000')
+        self.create_payment('cs_2', '5000')
+        self.create_payment('cs_3', '1000', payment_method='cash')
+
+        for session_id in ('cs_1', 'cs_2', 'cs_1', 'cs_3'):
+            apply_session_status(session_id, 'paid')
+        apply_session_status('cs_1', 'expired')
+
+        today = timezone.localdate()
+        self.assertEqual(self.rollups(), {
+            (today, self.course.id, 'transfer', Decimal('20000'), 2),
+            (today, self.course.id, 'cash', Decimal('1000'), 1),
+        })
+
+    def test_rebuild_matches_incremental(self):
+        """Тест пересчёта выручки командой с тем же результатом, что и пошаговый учёт"""
+        self.create_payment('cs_1', '15000', payment_date=self.yesterday)
+        self.create_payment('cs_2', '2000', course=self.other_course)
+        self.create_payment('cs_3', '3000')
+        for session_id in ('cs_1', 'cs_2'):
+            apply_session_status(session_id, 'paid')
+        incremental = self.rollups()
+
+        DailyRevenue.objects.update(total=0, count=0)
+        call_command('rebuild_revenue', stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+        # Пересчёт с даты не трогает более ранние дни
+        DailyRevenue.objects.filter(day=timezone.localdate(self.yesterday)).update(count=10)
+        call_command('rebuild_revenue', since=timezone.localdate().isoformat(), stdout=io.StringIO())
+        self.assertEqual(DailyRevenue.objects.get(day=timezone.localdate(self.yesterday)).count, 10)
+        self.assertEqual(DailyRevenue.objects.get(day=timezone.localdate()).count, 1)
+
+    def test_revenue_endpoint(self):
+        """Тест отчёта по выручке с группировкой и фильтрами"""
+        self.create_payment('cs_1', '15000', payment_date=self.yesterday)
+        self.create_payment('cs_2', '2000', course=self.other_course)
+        self.create_payment('cs_3', '3000', payment_method='cash')
+        for session_id in ('cs_1', 'cs_2', 'cs_3'):
+            apply_session_status(session_id, 'paid')
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'group_by': 'course'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['course'], Decimal(row['total']), row['count']) for row in response.data['results']],
+            [(self.course.id, Decimal('18000'), 2), (self.other_course.id, Decimal('2000'), 1)]
+        )
+
+        response = self.client.get(
+            self.url, {'date_from': timezone.localdate().isoformat(), 'group_by': 'payment_method'}
+        )
+        self.assertEqual(
+            {row['payment_method']: row['count'] for row in response.data['results']},
+            {'cash': 1, 'transfer': 1}
+        )
+
+        response = self.client.get(self.url, {'course': self.course.id, 'group_by': ''})
+        self.assertEqual(response.data['results'], [{'total': Decimal('18000'), 'count': 2}])
+
+        response = self.client.get(self.url, {'group_by': 'user'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
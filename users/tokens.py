@@ -0,0 +1,30 @@
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import User
+from users.permissions import MODERATORS_GROUP
+
+
+def user_claims(user):
+    """Claims, по которым ClaimsJWTAuthentication восстанавливает пользователя без БД"""
+    return {
+        'is_staff': user.is_staff,
+        'is_moderator': user.groups.filter(name=MODERATORS_GROUP).exists(),
+    }
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh-токен, выдающий access-токены с ролями пользователя.
+
+    Роли читаются из БД при каждой выдаче access-токена (вход и обновление),
+    поэтому их изменение применяется не позже ACCESS_TOKEN_LIFETIME.
+    """
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        user = User.objects.get(**{api_settings.USER_ID_FIELD: self[api_settings.USER_ID_CLAIM]})
+        for claim, value in user_claims(user).items():
+            access[claim] = value
+        return access
@@ -1,15 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from users.apps import UsersConfig
-from users.views import (PaymentListAPIView, UserCreateAPIView, UserRetrieveAPIView,
+from users.views import (PaymentListAPIView, PaymentExportAPIView, UserCreateAPIView, UserRetrieveAPIView,
                          UserUpdateAPIView, UserDestroyAPIView, CreatePaymentAPIView,
-                         PaymentStatusAPIView, PaymentSuccessAPIView, PaymentCancelAPIView)
+                         PaymentStatusAPIView, PaymentSuccessAPIView, PaymentCancelAPIView,
+                         StripeWebhookAPIView, PaymentRevenueAPIView, AsyncPaymentStatusAPIView)
 
 app_name = UsersConfig.name
 
 urlpatterns = [
     path('payments/', PaymentListAPIView.as_view(), name='payment-list'),
+    path('payments/export/', PaymentExportAPIView.as_view(), name='payment-export'),
+    path('payments/revenue/', PaymentRevenueAPIView.as_view(), name='payment-revenue'),
     path('register/', UserCreateAPIView.as_view(), name='register'),
     path('login/', TokenObtainPairView.as_view(), name='login'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -17,7 +21,10 @@ urlpatterns = [
     path('<int:pk>/update/', UserUpdateAPIView.as_view(), name='user-update'),
     path('<int:pk>/delete/', UserDestroyAPIView.as_view(), name='user-delete'),
     path('payments/create/', CreatePaymentAPIView.as_view(), name='payment-create'),
-    path('payments/<int:payment_id>/status/', PaymentStatusAPIView.as_view(), name='payment-status'),
+    path('payments/<int:payment_id>/status/',
+         (AsyncPaymentStatusAPIView if settings.ASYNC_VIEWS else PaymentStatusAPIView).as_view(),
+         name='payment-status'),
     path('payments/success/', PaymentSuccessAPIView.as_view(), name='payment-success'),
     path('payments/cancel/', PaymentCancelAPIView.as_view(), name='payment-cancel'),
+    path('payments/webhook/', StripeWebhookAPIView.as_view(), name='stripe-webhook'),
 ]
\ No newline at end of file
@@ -1,18 +1,31 @@
+from itertools import islice
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import generics, status
 from rest_framework.generics import CreateAPIView, RetrieveAPIView, UpdateAPIView, DestroyAPIView
 from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 
-from users.models import Payment, User
+from config.async_views import AsyncAPIViewMixin
+from config.renderers import CSVRenderer, NDJSONRenderer
+from materials.fast_serializers import serialize_rows
+from users.models import DailyRevenue, Payment, User
+from users.paginators import PaymentPagination
 from users.permissions import IsOwnerOrStaff
-from users.serializers import PaymentSerializer, UserSerializers
-from materials.services import create_stripe_product, create_stripe_price, create_stripe_checkout_session, \
-    get_stripe_session_status
+from users.serializers import PaymentSerializer, RevenueQuerySerializer, UserSerializers
+from materials.outbox import enqueue
+from users.services import (apply_session_status, arefresh_payment_status, get_catalog_entry,
+                            refresh_payment_status, session_status, start_checkout)
+from users.tasks import create_checkout_session
 from materials.models import Course, Lesson
 
 
@@ -28,14 +41,107 @@ class PaymentListAPIView(generics.ListAPIView):
     Доступная сортировка:
     - payment_date: Дата оплаты
     - -payment_date: Дата оплаты в обратном порядке
+
+    Пагинация (необязательная):
+    - page_size: Количество платежей на странице
+    - pagination=cursor: Keyset-пагинация по (payment_date, id), далее по ссылкам next/previous
     """
     serializer_class = PaymentSerializer
     queryset = Payment.objects.all()
+    pagination_class = PaymentPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['paid_course', 'paid_lesson', 'payment_method']
     ordering_fields = ['payment_date']
 
 
+class PaymentExportAPIView(generics.GenericAPIView):
+    """
+    Потоковая выгрузка всех платежей в NDJSON или CSV.
+
+    Требуется аутентификация и права администратора.
+
+    Формат: ?format=ndjson (по умолчанию) или ?format=csv, либо заголовок Accept.
+    Фильтры и сортировка - как у списка платежей (paid_course, paid_lesson,
+    payment_method, ordering=payment_date). Строки читаются серверным
+    курсором порциями по chunk_size, поэтому память не зависит от объёма.
+    """
+    serializer_class = PaymentSerializer
+    queryset = Payment.objects.all()
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['paid_course', 'paid_lesson', 'payment_method']
+    ordering_fields = ['payment_date']
+    chunk_size = 2000
+
+    def get(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.iter_rows(self.iter_rows(queryset)),
+            content_type=renderer.media_type if renderer.charset is None
+            else f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = f'attachment; filename="payments.{renderer.format}"'
+        return response
+
+    def iter_rows(self, queryset):
+        # Та же сериализация, что у PaymentListAPIView, но порциями из строк .values()
+        serializer = self.get_serializer()
+        rows = queryset.values().iterator(chunk_size=self.chunk_size)
+        while batch := list(islice(rows, self.chunk_size)):
+            yield from serialize_rows(serializer, batch)
+
+
+class PaymentRevenueAPIView(APIView):
+    """
+    Выручка по оплаченным платежам из таблицы DailyRevenue.
+
+    Требуется аутентификация и права администратора.
+
+    Параметры:
+    - date_from, date_to: Период по дням (YYYY-MM-DD, включительно)
+    - course, lesson, payment_method: Фильтры
+    - group_by: Поля группировки через запятую: day, course, lesson, payment_method
+      (по умолчанию day; пустое значение - итог за период)
+
+    Читаются только агрегаты по дням, поэтому время ответа зависит от длины
+    периода, а не от числа платежей.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        params = RevenueQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+
+        rollups = DailyRevenue.objects.all()
+        if 'date_from' in query:
+            rollups = rollups.filter(day__gte=query['date_from'])
+        if 'date_to' in query:
+            rollups = rollups.filter(day__lte=query['date_to'])
+        for field in ('course', 'lesson', 'payment_method'):
+            if field in query:
+                rollups = rollups.filter(**{field: query[field]})
+
+        group_by = query['group_by']
+        columns = {field: f'{field}_id' if field in ('course', 'lesson') else field for field in group_by}
+        totals = {'total_amount': Sum('total'), 'payments_count': Sum('count')}
+        if columns:
+            rows = rollups.values(*columns.values()).annotate(**totals).order_by(*columns.values())
+        else:
+            rows = [rollups.aggregate(**totals)]
+        results = [
+            {
+                **{field: row[column] for field, column in columns.items()},
+                'total': row['total_amount'] or 0,
+                'count': row['payments_count'] or 0,
+            }
+            for row in rows
+        ]
+        return Response({'group_by': group_by, 'results': results})
+
+
 class UserCreateAPIView(CreateAPIView):
     """
     Регистрация нового пользователя.
@@ -85,7 +191,14 @@ class UserDestroyAPIView(DestroyAPIView):
 
 # Stripe
 class CreatePaymentAPIView(APIView):
-    """Создание платежа и сессии оплаты в Stripe"""
+    """
+    Создание платежа и сессии оплаты в Stripe.
+
+    При STRIPE_ASYNC_CHECKOUT сессия создаётся задачей Celery: ответ 202
+    возвращается сразу с платежом в статусе creating, ссылку на оплату
+    клиент получает из PaymentStatusAPIView. Иначе сессия создаётся в
+    запросе и возвращается 201.
+    """
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -107,101 +220,123 @@ class CreatePaymentAPIView(APIView):
             product = get_object_or_404(Lesson, id=lesson_id)
             product_type = 'lesson'
 
-        # Создаем продукт в Stripe
-        stripe_product = create_stripe_product(
-            name=product.title,
-            description=product.description
-        )
-
-        if not stripe_product:
-            return Response(
-                {"error": "Ошибка при создании продукта в Stripe"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-
-        # Предположим, что цена уже хранится в продукте
-        if product_type == 'course':
-            amount = 15000
-        else:
-            amount = 2000
-
-        stripe_price = create_stripe_price(
-            product_id=stripe_product.id,
-            amount=amount
-        )
-
-        if not stripe_price:
-            return Response(
-                {"error": "Ошибка при создании цены в Stripe"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        success_url = request.build_absolute_uri(reverse('users:payment-success'))
+        cancel_url = request.build_absolute_uri(reverse('users:payment-cancel'))
+
+        # Создаем запись о платеже в нашей системе; сумма берётся из каталога цен
+        with transaction.atomic():
+            payment = Payment.objects.create(
+                user=user,
+                paid_course=product if product_type == 'course' else None,
+                paid_lesson=product if product_type == 'lesson' else None,
+                amount=get_catalog_entry(product).amount,
+                payment_method='transfer',
+                stripe_payment_status='creating'
             )
+            if settings.STRIPE_ASYNC_CHECKOUT:
+                enqueue(create_checkout_session, args=(payment.id, success_url, cancel_url))
+                return Response(PaymentSerializer(payment).data, status=status.HTTP_202_ACCEPTED)
 
         # Создаем сессию оплаты
-        success_url = request.build_absolute_uri(reverse('payment-success'))
-        cancel_url = request.build_absolute_uri(reverse('payment-cancel'))
-
-        stripe_session = create_stripe_checkout_session(
-            price_id=stripe_price.id,
-            success_url=success_url,
-            cancel_url=cancel_url
-        )
-
-        if not stripe_session:
+        error = start_checkout(payment, success_url, cancel_url)
+        if error:
+            payment.stripe_payment_status = 'failed'
+            payment.save(update_fields=['stripe_payment_status'])
             return Response(
-                {"error": "Ошибка при создании сессии оплаты"},
+                {"error": error},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        # Создаем запись о платеже в нашей системе
-        payment = Payment.objects.create(
-            user=user,
-            paid_course=product if product_type == 'course' else None,
-            paid_lesson=product if product_type == 'lesson' else None,
-            amount=amount,
-            payment_method='transfer',
-            stripe_product_id=stripe_product.id,
-            stripe_price_id=stripe_price.id,
-            stripe_session_id=stripe_session.id,
-            stripe_payment_url=stripe_session.url,
-            stripe_payment_status='pending'
-        )
-
         serializer = PaymentSerializer(payment)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 class PaymentStatusAPIView(APIView):
-    """Проверка статуса платежа"""
+    """
+    Проверка статуса платежа.
+
+    Статус читается из БД (его обновляет вебхук Stripe); Stripe опрашивается,
+    только если статус не окончательный и не проверялся дольше STRIPE_STATUS_TTL.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, payment_id):
         payment = get_object_or_404(Payment, id=payment_id, user=request.user)
+        payment = refresh_payment_status(payment)
+
+        serializer = PaymentSerializer(payment)
+        return Response(serializer.data)
+
 
-        # Обновляем статус из Stripe
-        session_status = get_stripe_session_status(payment.stripe_session_id)
+class AsyncPaymentStatusAPIView(AsyncAPIViewMixin, PaymentStatusAPIView):
+    """PaymentStatusAPIView на асинхронном ORM для ASGI (settings.ASYNC_VIEWS)"""
 
-        if session_status:
-            payment.stripe_payment_status = session_status.payment_status
-            payment.save()
+    async def get(self, request, payment_id):
+        try:
+            payment = await Payment.objects.aget(id=payment_id, user=request.user)
+        except Payment.DoesNotExist:
+            raise Http404
+        payment = await arefresh_payment_status(payment)
 
         serializer = PaymentSerializer(payment)
         return Response(serializer.data)
 
 
 class PaymentSuccessAPIView(APIView):
-    """Обработка успешной оплаты"""
+    """
+    Обработка успешной оплаты.
+
+    Параметр session_id не подтверждает оплату сам по себе: статус берётся
+    из Stripe (или уже пришёл вебхуком).
+    """
 
     def get(self, request):
         session_id = request.GET.get('session_id')
         if session_id:
             payment = Payment.objects.filter(stripe_session_id=session_id).first()
             if payment:
-                payment.stripe_payment_status = 'paid'
-                payment.save()
+                refresh_payment_status(payment)
 
         return Response({"message": "Оплата прошла успешно!"})
 
 
+class StripeWebhookAPIView(APIView):
+    """
+    Вебхук Stripe для событий сессий оплаты.
+
+    Подпись проверяется секретом STRIPE_WEBHOOK_SECRET. Обрабатываются
+    checkout.session.completed, async_payment_succeeded, async_payment_failed
+    и expired; повторная доставка события ничего не меняет.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    EVENT_STATUSES = {
+        'checkout.session.async_payment_succeeded': 'paid',
+        'checkout.session.async_payment_failed': 'failed',
+        'checkout.session.expired': 'expired',
+    }
+
+    def post(self, request):
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body,
+                request.headers.get('Stripe-Signature', ''),
+                settings.STRIPE_WEBHOOK_SECRET,
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response({"error": "Неверная подпись или тело события"}, status=status.HTTP_400_BAD_REQUEST)
+
+        session = event['data']['object']
+        if event['type'] == 'checkout.session.completed':
+            # При отложенных способах оплаты payment_status будет unpaid до async_payment_succeeded
+            apply_session_status(session['id'], session_status(session))
+        elif event['type'] in self.EVENT_STATUSES:
+            apply_session_status(session['id'], self.EVENT_STATUSES[event['type']])
+
+        return Response(status=status.HTTP_200_OK)
+
+
 class PaymentCancelAPIView(APIView):
     """Обработка отмены оплаты"""
 